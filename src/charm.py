@@ -7,11 +7,27 @@
 import logging
 
 import ops
-from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus
+import yaml
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    WaitingStatus,
+)
 from ops.pebble import ExecError
 
-from literals import APPLICATION_PORT
+import slapd
+from literals import (
+    APPLICATION_PORT,
+    DATA_DIR,
+    READY_CHECK,
+    SUBTREE_MAXSIZE,
+    WORKLOAD_OPTIONS,
+)
+from relations.peer import PeerReplication
 from relations.provider import LDAPProvider
+from relations.replica import LDAPReplicaRequirer
+from relations.restart import RollingRestart
 from state import State
 from utils import log_event_handler, random_string
 
@@ -37,6 +53,7 @@ class OpenLDAPK8SCharm(ops.CharmBase):
             self.on.openldap_pebble_ready, self._on_openldap_pebble_ready
         )
         self.framework.observe(self.on.config_changed, self._on_config_changed)
+        self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.restart_action, self._on_restart)
         self.framework.observe(
             self.on.get_admin_password_action, self._on_get_admin_password
@@ -44,7 +61,13 @@ class OpenLDAPK8SCharm(ops.CharmBase):
         self.framework.observe(
             self.on.load_test_users_action, self._on_load_test_users
         )
+        self.framework.observe(self.on.db_stats_action, self._on_db_stats)
+        self.framework.observe(self.on.compact_action, self._on_compact)
+        self.framework.observe(self.on.sync_ldif_action, self._on_sync_ldif)
         self.provider = LDAPProvider(self)
+        self.peer = PeerReplication(self)
+        self.rolling_restart = RollingRestart(self)
+        self.replica = LDAPReplicaRequirer(self)
 
     @log_event_handler(logger)
     def _on_install(self, event):
@@ -73,6 +96,26 @@ class OpenLDAPK8SCharm(ops.CharmBase):
         """
         self.update(event)
 
+    @log_event_handler(logger)
+    def _on_update_status(self, event):
+        """Warm up a slapd process that was restarted behind our back.
+
+        Args:
+            event: The update status event.
+        """
+        container = self.unit.get_container(self.name)
+        if not self._state.is_ready() or not self._state.base_dn:
+            return
+
+        if not container.can_connect():
+            return
+
+        # Warm-up replaces the unit status for its duration only.
+        if slapd.is_running(container) and not slapd.is_warm(container):
+            status = self.unit.status
+            self.warm_up(container)
+            self.unit.status = status
+
     def _create_startup_ldif(self, event, container):
         """Create startup.ldif file.
 
@@ -157,10 +200,136 @@ class OpenLDAPK8SCharm(ops.CharmBase):
             event.defer()
             return
 
-        self.unit.status = MaintenanceStatus("restarting openldap")
-        container.restart(self.name)
-        event.set_results({"result": "openldap successfully restarted"})
-        self.unit.status = ActiveStatus()
+        if not self._state.is_ready():
+            event.fail("peer relation not ready")
+            return
+
+        try:
+            results = self.rolling_restart.request()
+        except ExecError as e:
+            event.fail(f"restart failed: {e.stderr}")
+            return
+        except TimeoutError as e:
+            event.fail(f"restart failed: {e}")
+            return
+
+        if results is not None:
+            event.set_results({"result": "openldap successfully restarted"})
+        else:
+            event.set_results({"result": "openldap restart queued"})
+
+    def _on_db_stats(self, event):
+        """Report database statistics, action handler.
+
+        Args:
+            event: The event triggered by the `db-stats` action.
+        """
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.fail("cannot connect to the openldap container")
+            return
+
+        try:
+            stats = slapd.db_stats(container, DATA_DIR)
+        except ExecError as e:
+            event.fail(f"mdb_stat failed: {e.stderr}")
+            return
+        event.set_results(stats)
+
+    def _on_compact(self, event):
+        """Compact the database during a short service stop, action handler.
+
+        Args:
+            event: The event triggered by the `compact` action.
+        """
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.fail("cannot connect to the openldap container")
+            return
+
+        if not self._state.is_ready():
+            event.fail("peer relation not ready")
+            return
+
+        # Compaction stops the service, so it waits for the restart lock.
+        try:
+            results = self.rolling_restart.request("compact")
+        except ExecError as e:
+            event.fail(f"compaction failed: {e.stderr}")
+            return
+        except TimeoutError as e:
+            event.fail(f"compaction failed: {e}")
+            return
+
+        if results is None:
+            event.set_results({"result": "compaction queued"})
+            return
+        event.set_results({"result": "database compacted", **results})
+
+    def _on_sync_ldif(self, event):
+        """Converge the directory on a desired-state LDIF, action handler.
+
+        Args:
+            event: The event triggered by the `sync-ldif` action.
+        """
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.fail("cannot connect to the openldap container")
+            return
+
+        base_dn = self._state.base_dn
+        base = event.params.get("base") or base_dn
+        try:
+            desired = slapd.parse_ldif(event.params["ldif"])
+        except ValueError as e:
+            event.fail(f"invalid ldif: {e}")
+            return
+
+        suffix = slapd.normalize_dn(base)
+        for dn, _ in desired:
+            normalized = slapd.normalize_dn(dn)
+            if normalized != suffix and not normalized.endswith(f",{suffix}"):
+                event.fail(f"{dn} is not under {base}")
+                return
+
+        attributes = {
+            name.lower(): name for _, entry in desired for name in entry
+        }
+        password = self._state.bind_password
+        self.unit.status = MaintenanceStatus("Running action.")
+        try:
+            current = slapd.search_entries(
+                container, base_dn, password, base, list(attributes.values())
+            )
+            adds, modifies, deletes = slapd.diff_entries(
+                current,
+                desired,
+                delete=event.params.get("delete", False),
+                keep=[base_dn, f"cn=admin,{base_dn}", base],
+            )
+
+            records = adds + modifies + deletes
+            size = event.params.get("batch-size", 500)
+            batches = []
+            for start in range(0, len(records), size):
+                end = start + size
+                batches.append(records[start:end])
+            for batch in batches:
+                slapd.modify_entries(container, base_dn, password, batch)
+        except ExecError as e:
+            event.fail(f"sync failed: {e.stderr}")
+            return
+        finally:
+            self.unit.status = ActiveStatus()
+
+        event.set_results(
+            {
+                "added": len(adds),
+                "modified": len(modifies),
+                "deleted": len(deletes),
+                "batches": len(batches),
+            }
+        )
 
     def _on_get_admin_password(self, event):
         """Get admin password, action handler.
@@ -171,6 +340,54 @@ class OpenLDAPK8SCharm(ops.CharmBase):
         admin_password = self._state.bind_password
         event.set_results({"admin-password": admin_password})
 
+    def warm_up(self, container):
+        """Prime the page cache before the unit reports itself ready.
+
+        Args:
+            container: OpenLDAP container.
+        """
+        self.unit.status = MaintenanceStatus("warming up")
+        duration = slapd.warm_up(
+            container,
+            self._state.base_dn,
+            self._state.bind_password,
+            self._warmup_searches(),
+            self.config["warmup-read-ahead"],
+            self.config["warmup-size-limit"],
+        )
+        logger.info(f"warm-up completed in {duration:.2f}s")
+
+        relation = self.model.get_relation("peer")
+        if relation:
+            relation.data[self.unit]["warmup-seconds"] = f"{duration:.2f}"
+
+    def _warmup_searches(self):
+        """Parse the priming searches run by warm-up.
+
+        Returns:
+            List of LDAP filters.
+
+        Raises:
+            ValueError: in case of a malformed filter.
+        """
+        searches = [
+            search.strip()
+            for search in self.config["warmup-searches"].split(";")
+            if search.strip()
+        ]
+        for search in searches:
+            # Literal parentheses are escaped in filters, so each one must
+            # close the filter only at its very end.
+            depth = 0
+            for position, char in enumerate(search):
+                depth += {"(": 1, ")": -1}.get(char, 0)
+                closed = depth == 0 and position < len(search) - 1
+                if depth < 0 or closed:
+                    raise ValueError("invalid warmup-searches")
+            if depth or not search.startswith("("):
+                raise ValueError("invalid warmup-searches")
+        return searches
+
     def validate(self):
         """Validate that configuration and relations are valid and ready.
 
@@ -180,38 +397,168 @@ class OpenLDAPK8SCharm(ops.CharmBase):
         if not self._state.is_ready():
             raise ValueError("peer relation not ready")
 
-    def update(self, event):
-        """Update the openldap server configuration and re-plan its execution.
+        provider = self.replica.provider
+        if provider and provider["base_dn"] != self.config["ldap-base-dn"]:
+            raise ValueError("ldap-base-dn differs from the replica provider")
+
+        if self.config["replica-sync-type"] not in (
+            "refreshAndPersist",
+            "refreshOnly",
+        ):
+            raise ValueError("invalid replica-sync-type")
+
+        self._subtree_databases()
+        self._warmup_searches()
+
+        if self.config["sort-max-concurrent"] < 0:
+            raise ValueError("sort-max-concurrent must not be negative")
+
+        if self.config["proxy-remote-url"]:
+            proxy_base_dn = self.config["proxy-base-dn"].lower()
+            base_dn = self.config["ldap-base-dn"].lower()
+            if not proxy_base_dn:
+                raise ValueError("proxy-base-dn is required in proxy mode")
+            if not (
+                self.config["proxy-bind-dn"]
+                and self.config["proxy-bind-password"]
+            ):
+                raise ValueError(
+                    "proxy-bind-dn and proxy-bind-password are required "
+                    "in proxy mode"
+                )
+            if (
+                proxy_base_dn == base_dn
+                or proxy_base_dn.endswith(f",{base_dn}")
+                or base_dn.endswith(f",{proxy_base_dn}")
+            ):
+                raise ValueError("proxy-base-dn overlaps ldap-base-dn")
+
+    def _has_directory_config(self):
+        """Report whether optional cn=config features are enabled.
+
+        Returns:
+            A boolean stating whether `_configure_directory` has work to do.
+        """
+        replica = self.unit.is_leader() and (
+            self.replica.provider or self.provider.has_replicas()
+        )
+        return bool(
+            self.config["proxy-remote-url"]
+            or replica
+            or self.config["sort-max-concurrent"]
+            or self._subtree_databases()
+        )
 
-        Args:
-            event: The event triggered when the relation changed.
+    def _subtree_databases(self):
+        """Parse the subtrees served by their own database.
+
+        Returns:
+            List of dictionaries with the `rdn` of each subtree relative to
+            the base DN, its `maxsize` in bytes and the attributes to
+            `index`.
+
+        Raises:
+            ValueError: in case of invalid configuration.
         """
         try:
-            self.validate()
-        except ValueError as err:
-            self.unit.status = BlockedStatus(str(err))
-            return
+            subtrees = yaml.safe_load(self.config["subtree-databases"]) or []
+        except yaml.YAMLError as e:
+            raise ValueError("invalid subtree-databases") from e
 
-        container = self.unit.get_container(self.name)
-        if not container.can_connect():
-            event.defer()
-            return
+        if not isinstance(subtrees, list):
+            raise ValueError("invalid subtree-databases")
 
-        container.push_path("templates/", "/")
-        self.model.unit.open_port(port=APPLICATION_PORT, protocol="tcp")
+        parsed = []
+        for subtree in subtrees:
+            try:
+                parsed.append(
+                    {
+                        "rdn": str(subtree["rdn"]).strip(),
+                        "maxsize": int(
+                            subtree.get("maxsize", SUBTREE_MAXSIZE)
+                        ),
+                        "index": subtree.get("index", []),
+                    }
+                )
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                raise ValueError("invalid subtree-databases") from e
+
+            # Each subtree is a single RDN directly under the base DN.
+            rdn, index = parsed[-1]["rdn"], parsed[-1]["index"]
+            if not rdn or "," in rdn or "=" not in rdn:
+                raise ValueError("invalid subtree-databases")
+            if not isinstance(index, list) or not all(
+                isinstance(name, str) for name in index
+            ):
+                raise ValueError("invalid subtree-databases")
+        return parsed
+
+    def _configure_directory(self, container):
+        """Apply the optional cn=config features to the running server.
 
-        logger.info("configuring openldap")
+        Args:
+            container: OpenLDAP container.
+        """
+        if self.config["proxy-remote-url"]:
+            templates = self.config["proxy-cache-templates"].split(";")
+            slapd.configure_proxy(
+                container,
+                self.config["proxy-base-dn"],
+                self.config["proxy-remote-url"],
+                {
+                    "templates": [t.strip() for t in templates if t.strip()],
+                    "ttl": self.config["proxy-cache-ttl"],
+                    "attributes": self.config["proxy-cache-attributes"],
+                    "max_entries": self.config["proxy-cache-max-entries"],
+                },
+                {
+                    "dn": self.config["proxy-bind-dn"],
+                    "password": self.config["proxy-bind-password"],
+                },
+            )
+
+        subtrees = self._subtree_databases()
+        for subtree in subtrees:
+            slapd.configure_subtree(
+                container, self.config["ldap-base-dn"], subtree
+            )
+
+        # Replication settings cover the subtree databases as well.
+        if self.unit.is_leader() and self.replica.provider:
+            self.replica.follow(container)
+        elif subtrees and not self.unit.is_leader():
+            self.peer.follow(container)
+
+        if self.unit.is_leader() and self.provider.has_replicas():
+            slapd.configure_accesslog(container, self._state.base_dn)
+        elif subtrees and self.unit.is_leader() and self._state.snapshot:
+            slapd.ensure_tree_provider(container, self._state.base_dn)
+
+        if self.config["sort-max-concurrent"]:
+            slapd.configure_sssvlv(
+                container,
+                self.config["ldap-base-dn"],
+                {
+                    "max": self.config["sort-max-concurrent"],
+                    "max_keys": self.config["sort-max-keys"],
+                    "max_per_conn": self.config["vlv-max-per-connection"],
+                },
+                self.config["sort-indexed-attributes"].split(),
+            )
 
+    def _pebble_layer(self):
+        """Build the pebble layer running slapd and its readiness check.
+
+        Returns:
+            The pebble layer as a dictionary.
+        """
+        # Only options read by the image belong in the service environment,
+        # changing charm-side options must not restart slapd.
         context = {}
         for key, value in self.config.items():
-            updated_key = key.upper().replace("-", "_")
-            context[updated_key] = value
-
-        # Set provider values in state
-        self._state.bind_password = self._state.bind_password or random_string(
-            12
-        )
-        self._state.base_dn = self.config["ldap-base-dn"]
+            if key in WORKLOAD_OPTIONS or key.startswith("ldap-"):
+                updated_key = key.upper().replace("-", "_")
+                context[updated_key] = value
 
         context.update(
             {
@@ -220,9 +567,7 @@ class OpenLDAPK8SCharm(ops.CharmBase):
                 "LDAP_TLS": "false",
             }
         )
-
-        logger.info("planning openldap execution")
-        pebble_layer = {
+        return {
             "summary": "openldap layer",
             "services": {
                 self.name: {
@@ -233,11 +578,118 @@ class OpenLDAPK8SCharm(ops.CharmBase):
                     "environment": context,
                 }
             },
+            "checks": {
+                READY_CHECK: {
+                    "override": "replace",
+                    "level": "ready",
+                    "period": "5s",
+                    "threshold": 1,
+                    "exec": {"command": slapd.ready_command()},
+                }
+            },
         }
-        container.add_layer(self.name, pebble_layer, combine=True)
+
+    def _apply_layer(self, container, layer):
+        """Add the layer and restart or replan the service to apply it.
+
+        A running service picks a changed plan up through a rolling restart
+        so that the other units keep serving in the meantime.
+
+        Args:
+            container: OpenLDAP container.
+            layer: pebble layer to apply.
+
+        Returns:
+            A tuple of whether the unit is ready and whether slapd was
+            started by the replan.
+        """
+        service = container.get_plan().services.get(self.name)
+        container.add_layer(self.name, layer, combine=True)
+        changed = container.get_plan().services.get(self.name) != service
+
+        running = container.get_services(self.name).get(self.name)
+        running = bool(running and running.is_running())
+        if changed and running:
+            # A failed restart leaves the unit blocked, not the hook failed,
+            # so that the released restart lock is committed.
+            try:
+                return self.rolling_restart.request() is not None, False
+            except (ExecError, TimeoutError) as e:
+                logger.error(f"restart failed: {e}")
+                return False, False
+
         container.replan()
+        return True, not running
+
+    def _configure_workload(self, container, event, started):
+        """Apply the directory configuration once slapd answers.
+
+        Args:
+            container: OpenLDAP container.
+            event: The event triggered when the relation changed.
+            started: whether slapd was just started and needs warming up.
+
+        Returns:
+            True if the configuration was applied.
+        """
+        try:
+            slapd.wait_until_running(container)
+            self._configure_directory(container)
+            if started:
+                self.warm_up(container)
+        except TimeoutError:
+            event.defer()
+            return False
+        except ExecError:
+            self.unit.status = BlockedStatus(
+                "failed to apply directory configuration"
+            )
+            return False
+        return True
+
+    def update(self, event):
+        """Update the openldap server configuration and re-plan its execution.
+
+        Args:
+            event: The event triggered when the relation changed.
+        """
+        try:
+            self.validate()
+        except ValueError as err:
+            self.unit.status = BlockedStatus(str(err))
+            return
+
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.defer()
+            return
+
+        container.push_path("templates/", "/")
+        self.model.unit.open_port(port=APPLICATION_PORT, protocol="tcp")
 
-        self.unit.status = ActiveStatus()
+        logger.info("configuring openldap")
+
+        # Set provider values in state
+        if self.unit.is_leader():
+            self._state.bind_password = (
+                self._state.bind_password or random_string(12)
+            )
+            self._state.base_dn = self.config["ldap-base-dn"]
+        elif not self._state.bind_password:
+            self.unit.status = WaitingStatus("waiting for leader")
+            event.defer()
+            return
+
+        logger.info("planning openldap execution")
+        ready, started = self._apply_layer(container, self._pebble_layer())
+
+        if started or self._has_directory_config():
+            if not self._configure_workload(container, event, started):
+                return
+
+        self.provider.update_all()
+        if ready:
+            self.unit.status = ActiveStatus()
 
 
 if __name__ == "__main__":  # pragma: nocover
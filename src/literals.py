@@ -4,3 +4,57 @@
 """Manager for handling charm literals."""
 
 APPLICATION_PORT = 389
+
+LOCAL_URL = f"ldap://localhost:{APPLICATION_PORT}"
+LDAPI_URL = "ldapi:///"
+
+CONFIG_DIR = "/etc/ldap/slapd.d"
+DATA_DIR = "/var/lib/ldap"
+
+SNAPSHOT_PATH = "/var/tmp/snapshot.ldif"
+SEED_MARKER = f"{DATA_DIR}/.seeded"
+
+# Operational attributes that slapadd accepts and that syncrepl needs in
+# order to resume from the snapshot's contextCSN.
+SNAPSHOT_ATTRIBUTES = [
+    "*",
+    "entryUUID",
+    "entryCSN",
+    "contextCSN",
+    "structuralObjectClass",
+    "creatorsName",
+    "createTimestamp",
+    "modifiersName",
+    "modifyTimestamp",
+]
+
+PEER_REPLICA_ID = 1
+
+COMPACT_DIR = "/var/lib/ldap-compact"
+
+# Charm options, besides the `ldap-*` ones, handed to the image.
+WORKLOAD_OPTIONS = ["charm-deployment-name"]
+
+READY_CHECK = "openldap-ready"
+DRAIN_MARKER = "/var/run/openldap.drain"
+
+PCACHE_DIR = f"{DATA_DIR}/pcache"
+
+ACCESSLOG_BASE = "cn=accesslog"
+ACCESSLOG_DIR = f"{DATA_DIR}/accesslog"
+REMOTE_REPLICA_ID = 2
+
+SEARCH_PAGE_SIZE = 1000
+
+SUBTREE_DIR = f"{DATA_DIR}/subtrees"
+SUBTREE_MAXSIZE = 1073741824
+# Replica ID offset between the consumers of glued subtree databases.
+SUBTREE_RID_STEP = 10
+
+# Holds the PID of the slapd process that went through warm-up.
+WARM_MARKER = "/var/run/openldap.warm"
+WARMUP_MAX_PASSES = 3
+# A pass at least this fraction of the previous one means latency settled.
+WARMUP_STEADY_RATIO = 0.8
+# Warm-up is cut short after this many seconds.
+WARMUP_TIMEOUT = 300
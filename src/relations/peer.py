@@ -0,0 +1,216 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""OpenLDAP peer relation hooks & helpers."""
+
+import logging
+import socket
+import time
+
+from ops.charm import CharmBase
+from ops.framework import Object
+from ops.model import ActiveStatus, MaintenanceStatus
+from ops.pebble import ExecError
+
+import slapd
+from literals import (
+    APPLICATION_PORT,
+    LOCAL_URL,
+    PEER_REPLICA_ID,
+    SEED_MARKER,
+    SNAPSHOT_PATH,
+)
+from utils import log_event_handler
+
+logger = logging.getLogger(__name__)
+
+
+class PeerReplication(Object):
+    """Seeds joining units from a leader snapshot and keeps them in sync.
+
+    The leader publishes a snapshot reference (its URL and contextCSN) in
+    the peer application databag. Units that have not been seeded yet
+    bulk-load the snapshot offline with `slapadd -q` and then follow the
+    leader with syncrepl, which resumes from the loaded contextCSN.
+
+    Hook events observed:
+        - leader-elected
+        - peer-relation-joined
+        - peer-relation-changed
+    """
+
+    def __init__(self, charm: CharmBase, relation_name: str = "peer") -> None:
+        """Construct PeerReplication object.
+
+        Args:
+            charm: the charm for which this relation is provided
+            relation_name: the name of the relation
+        """
+        self.relation_name = relation_name
+
+        super().__init__(charm, self.relation_name)
+        self.framework.observe(
+            charm.on.leader_elected, self._on_leader_elected
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_joined,
+            self._on_relation_joined,
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed,
+            self._on_relation_changed,
+        )
+        self.charm = charm
+
+    @log_event_handler(logger)
+    def _on_leader_elected(self, event):
+        """Handle leader elected event.
+
+        The new leader stops following the previous one, or follows the
+        remote provider in a replica deployment, and republishes the
+        snapshot reference so that the other units follow it instead.
+
+        Args:
+            event: leader elected event.
+        """
+        if not self.charm._state.is_ready() or not self.charm._state.base_dn:
+            return
+
+        container = self.charm.unit.get_container(self.charm.name)
+        if not container.can_connect() or not slapd.is_running(container):
+            event.defer()
+            return
+
+        # A replica leader takes over consuming from the remote provider.
+        if self.charm.replica.provider:
+            self.charm.replica.follow(container)
+        else:
+            slapd.unfollow_tree(container, self.charm._state.base_dn)
+        self.publish_snapshot(container)
+
+    @log_event_handler(logger)
+    def _on_relation_joined(self, event):
+        """Handle peer relation joined event.
+
+        Args:
+            event: relation joined event.
+        """
+        if not self.charm.unit.is_leader() or not self.charm._state.base_dn:
+            return
+
+        container = self.charm.unit.get_container(self.charm.name)
+        if not container.can_connect() or not slapd.is_running(container):
+            event.defer()
+            return
+
+        self.publish_snapshot(container)
+
+    @log_event_handler(logger)
+    def _on_relation_changed(self, event):
+        """Handle peer relation changed event.
+
+        Args:
+            event: relation changed event.
+        """
+        if self.charm.unit.is_leader():
+            return
+
+        snapshot = self.charm._state.snapshot
+        if not snapshot:
+            return
+
+        container = self.charm.unit.get_container(self.charm.name)
+        if not container.can_connect() or not slapd.is_running(container):
+            event.defer()
+            return
+
+        try:
+            # The offline load stops slapd, so it waits for the restart lock.
+            if not container.exists(SEED_MARKER):
+                if self.charm.rolling_restart.request("seed") is None:
+                    return
+            self.follow(container)
+        except (ExecError, TimeoutError) as e:
+            logger.error(f"seeding from {snapshot['url']} failed: {e}")
+            event.defer()
+            return
+
+        self.charm.unit.status = ActiveStatus()
+
+    def publish_snapshot(self, container):
+        """Publish a reference to the leader's snapshot in the peer databag.
+
+        Args:
+            container: OpenLDAP container.
+        """
+        base_dn = self.charm._state.base_dn
+        password = self.charm._state.bind_password
+
+        slapd.ensure_tree_provider(container, base_dn)
+        context_csn = slapd.context_csn(
+            container, LOCAL_URL, base_dn, password
+        )
+        self.charm._state.snapshot = {
+            "url": f"ldap://{socket.getfqdn()}:{APPLICATION_PORT}",
+            "base_dn": base_dn,
+            "context_csn": context_csn,
+        }
+
+        # The leader's database is the reference, it never needs seeding
+        # should it lose leadership.
+        if not container.exists(SEED_MARKER):
+            container.push(SEED_MARKER, context_csn or "", make_dirs=True)
+
+    def seed(self, container):
+        """Bulk-load the leader's snapshot into the local database.
+
+        slapd is stopped during the load, so this runs while the unit holds
+        the restart lock, which also waits until it answers and warms it up.
+
+        Args:
+            container: OpenLDAP container.
+        """
+        snapshot = self.charm._state.snapshot
+        self.charm.unit.status = MaintenanceStatus("seeding from snapshot")
+        base_dn = snapshot["base_dn"]
+        start = time.monotonic()
+
+        slapd.dump_snapshot(
+            container,
+            snapshot["url"],
+            base_dn,
+            self.charm._state.bind_password,
+            SNAPSHOT_PATH,
+        )
+        container.stop(self.charm.name)
+        try:
+            slapd.load_snapshot(container, base_dn, SNAPSHOT_PATH)
+        finally:
+            container.start(self.charm.name)
+
+        container.push(
+            SEED_MARKER, snapshot["context_csn"] or "", make_dirs=True
+        )
+        container.remove_path(SNAPSHOT_PATH)
+        logger.info(
+            f"seeded from {snapshot['url']} at contextCSN "
+            f"{snapshot['context_csn']} in {time.monotonic() - start:.1f}s"
+        )
+
+    def follow(self, container):
+        """Catch up with and keep following the leader once seeded.
+
+        Args:
+            container: OpenLDAP container.
+        """
+        snapshot = self.charm._state.snapshot
+        if not snapshot or not container.exists(SEED_MARKER):
+            return
+
+        slapd.follow_tree(
+            container,
+            snapshot["base_dn"],
+            PEER_REPLICA_ID,
+            snapshot["url"],
+            self.charm._state.bind_password,
+        )
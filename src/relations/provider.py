@@ -8,11 +8,13 @@
 
 
 import logging
+import socket
 
 from ops.charm import CharmBase
 from ops.framework import Object
 from ops.model import ActiveStatus, MaintenanceStatus
 
+import slapd
 from literals import APPLICATION_PORT
 from utils import log_event_handler
 
@@ -23,6 +25,7 @@ class LDAPProvider(Object):
     """Defines functionality for the 'provides' side of the 'ranger-client' relation.
 
     Hook events observed:
+        - leader-elected
         - relation-updated
         - relation-broken
     """
@@ -37,6 +40,9 @@ class LDAPProvider(Object):
         self.relation_name = relation_name
 
         super().__init__(charm, self.relation_name)
+        self.framework.observe(
+            charm.on.leader_elected, self._on_leader_elected
+        )
         self.framework.observe(
             charm.on[self.relation_name].relation_changed,
             self._on_relation_changed,
@@ -47,6 +53,37 @@ class LDAPProvider(Object):
         )
         self.charm = charm
 
+    @log_event_handler(logger)
+    def _on_leader_elected(self, event):
+        """Take over serving the replicas as the new leader.
+
+        Args:
+            event: leader elected event.
+        """
+        if not self.charm._state.is_ready() or not self.charm._state.base_dn:
+            return
+
+        if self.has_replicas():
+            container = self.charm.unit.get_container(self.charm.name)
+            if not container.can_connect() or not slapd.is_running(container):
+                event.defer()
+                return
+            slapd.configure_accesslog(container, self.charm._state.base_dn)
+
+        # Replicas follow the new leader's replication URL.
+        self.update_all()
+
+    def has_replicas(self):
+        """Report whether a related application replicates this directory.
+
+        Returns:
+            A boolean stating whether any related application is a replica.
+        """
+        return any(
+            relation.app and relation.data[relation.app].get("replica")
+            for relation in self.charm.model.relations[self.relation_name]
+        )
+
     @log_event_handler(logger)
     def _on_relation_changed(self, event):
         """Handle ldap relation changed event.
@@ -66,6 +103,14 @@ class LDAPProvider(Object):
 
         self.charm.unit.status = MaintenanceStatus("Managing ldap relation")
 
+        # Replicas of this deployment consume the accesslog (delta-syncrepl).
+        if data.get("replica"):
+            container = self.charm.unit.get_container(self.charm.name)
+            if not container.can_connect() or not slapd.is_running(container):
+                event.defer()
+                return
+            slapd.configure_accesslog(container, self.charm._state.base_dn)
+
         self._set_relation_data(event)
         self.charm.unit.status = ActiveStatus()
 
@@ -78,16 +123,76 @@ class LDAPProvider(Object):
         relation = self.charm.model.get_relation(
             self.relation_name, event.relation.id
         )
-        host = self.charm.config["charm-deployment-name"]
 
         if relation:
-            relation.data[self.charm.app].update(
-                {
-                    "ldap_url": f"ldap://{host}:{APPLICATION_PORT}",
-                    "base_dn": self.charm._state.base_dn,
-                    "admin_password": self.charm._state.bind_password,
-                }
+            self._write_changes(relation, self._connection_data())
+
+    def update_all(self):
+        """Reconcile the connection data of every related application.
+
+        Only keys whose values differ are written, so consumers whose
+        databag is already current see no relation-changed event.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        data = self._connection_data()
+        for relation in self.charm.model.relations[self.relation_name]:
+            if relation.app and relation.data[relation.app]:
+                self._write_changes(relation, data)
+
+    def _connection_data(self):
+        """Build the connection data published to related applications.
+
+        Returns:
+            Dictionary of LDAP url, the leader's URL replicas follow, base
+            DN, bind DN and password and the URL writes are referred to, if
+            any.
+        """
+        host = self.charm.config["charm-deployment-name"]
+        base_dn = self.charm._state.base_dn
+        bind_dn = f"cn=admin,{base_dn}"
+        password = self.charm._state.bind_password
+
+        # Binds to the proxied suffix are forwarded to the remote directory,
+        # so clients use the remote identity.
+        if self.charm.config["proxy-remote-url"]:
+            base_dn = self.charm.config["proxy-base-dn"]
+            bind_dn = self.charm.config["proxy-bind-dn"]
+            password = self.charm.config["proxy-bind-password"]
+
+        # Replicas refer writes to their provider.
+        provider = self.charm.replica.provider
+        return {
+            "ldap_url": f"ldap://{host}:{APPLICATION_PORT}",
+            # Only the leader logs writes for delta-syncrepl.
+            "ldap_replication_url": (
+                f"ldap://{socket.getfqdn()}:{APPLICATION_PORT}"
+            ),
+            "base_dn": base_dn,
+            "bind_dn": bind_dn,
+            "admin_password": password,
+            "ldap_write_url": provider["ldap_url"] if provider else "",
+        }
+
+    def _write_changes(self, relation, data):
+        """Write the keys of data that differ from the relation databag.
+
+        Args:
+            relation: relation to update.
+            data: desired databag content.
+        """
+        databag = relation.data[self.charm.app]
+        changes = {
+            key: value
+            for key, value in data.items()
+            if databag.get(key, "") != value
+        }
+        if changes:
+            logger.info(
+                f"updating {sorted(changes)} on relation {relation.id}"
             )
+            databag.update(changes)
 
     @log_event_handler(logger)
     def _on_relation_broken(self, event):
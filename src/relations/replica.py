@@ -0,0 +1,146 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""OpenLDAP replica relation hooks & helpers."""
+
+import logging
+
+from ops.charm import CharmBase
+from ops.framework import Object
+from ops.pebble import ExecError
+
+import slapd
+from literals import ACCESSLOG_BASE, REMOTE_REPLICA_ID
+from utils import log_event_handler
+
+logger = logging.getLogger(__name__)
+
+
+class LDAPReplicaRequirer(Object):
+    """Defines functionality for the 'requires' side of the 'ldap-replica' relation.
+
+    The leader consumes the remote directory with delta-syncrepl and refers
+    writes to it; the other units follow the leader through the peer
+    relation.
+
+    Hook events observed:
+        - relation-created
+        - relation-changed
+        - relation-broken
+    """
+
+    def __init__(
+        self, charm: CharmBase, relation_name: str = "ldap-replica"
+    ) -> None:
+        """Construct LDAPReplicaRequirer object.
+
+        Args:
+            charm: the charm for which this relation is required
+            relation_name: the name of the relation
+        """
+        self.relation_name = relation_name
+
+        super().__init__(charm, self.relation_name)
+        self.framework.observe(
+            charm.on[self.relation_name].relation_created,
+            self._on_relation_created,
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed,
+            self._on_relation_changed,
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_broken,
+            self._on_relation_broken,
+        )
+        self.charm = charm
+
+    @property
+    def provider(self):
+        """Connection data published by the remote provider, if any.
+
+        Returns:
+            Dictionary with `ldap_url`, `base_dn` and `admin_password`, or
+            None if the relation is missing or not ready.
+        """
+        relation = self.charm.model.get_relation(self.relation_name)
+        if not relation or not relation.app:
+            return None
+
+        data = relation.data[relation.app]
+        if not all(
+            data.get(key) for key in ("ldap_url", "base_dn", "admin_password")
+        ):
+            return None
+        return dict(data)
+
+    @log_event_handler(logger)
+    def _on_relation_created(self, event):
+        """Ask the provider to log writes for delta-syncrepl.
+
+        Args:
+            event: relation created event.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        event.relation.data[self.charm.app].update({"replica": "true"})
+
+    @log_event_handler(logger)
+    def _on_relation_changed(self, event):
+        """Handle ldap-replica relation changed event.
+
+        Args:
+            event: relation changed event.
+        """
+        self.charm.update(event)
+
+    @log_event_handler(logger)
+    def _on_relation_broken(self, event):
+        """Stop consuming from the remote provider.
+
+        Args:
+            event: relation broken event.
+        """
+        if not self.charm.unit.is_leader():
+            return
+
+        container = self.charm.unit.get_container(self.charm.name)
+        if not container.can_connect() or not slapd.is_running(container):
+            event.defer()
+            return
+
+        try:
+            slapd.unfollow_tree(container, self.charm._state.base_dn)
+        except ExecError:
+            event.defer()
+            return
+        # Consumers no longer have writes referred to the provider.
+        self.charm.provider.update_all()
+        logger.info("LDAP replica relation removed, accepting writes.")
+
+    def follow(self, container):
+        """Consume the remote provider with delta-syncrepl.
+
+        Args:
+            container: OpenLDAP container.
+        """
+        provider = self.provider
+        config = self.charm.config
+        # Only the provider leader logs writes, the load-balanced URL can
+        # reach any of its units.
+        url = provider.get("ldap_replication_url") or provider["ldap_url"]
+        slapd.follow_tree(
+            container,
+            provider["base_dn"],
+            REMOTE_REPLICA_ID,
+            url,
+            provider["admin_password"],
+            refer=provider["ldap_url"],
+            type=config["replica-sync-type"],
+            interval=config["replica-refresh-interval"],
+            retry=f'"{config["replica-retry"]}"',
+            logbase=f'"{ACCESSLOG_BASE}"',
+            logfilter='"(&(objectClass=auditWriteObject)(reqResult=0))"',
+            syncdata="accesslog",
+        )
@@ -0,0 +1,223 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Rolling restarts coordinated through the peer relation."""
+
+import logging
+import time
+
+from ops.charm import CharmBase
+from ops.framework import Object
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    WaitingStatus,
+)
+from ops.pebble import ExecError
+
+import slapd
+from literals import COMPACT_DIR, DATA_DIR, DRAIN_MARKER
+from utils import log_event_handler
+
+logger = logging.getLogger(__name__)
+
+
+class RollingRestart(Object):
+    """Restarts units one at a time.
+
+    Units ask for a restart in their peer databag and the leader grants the
+    restart lock to one of them at a time in the application databag. The
+    granted unit drains, restarts, waits until it is ready again and then
+    withdraws its request, which lets the leader grant the next unit.
+    Compaction and seeding requests also hold the lock while the database
+    is rewritten with the service stopped.
+
+    Hook events observed:
+        - leader-elected
+        - peer-relation-changed
+        - peer-relation-departed
+    """
+
+    def __init__(self, charm: CharmBase, relation_name: str = "peer") -> None:
+        """Construct RollingRestart object.
+
+        Args:
+            charm: the charm for which restarts are coordinated
+            relation_name: the name of the peer relation
+        """
+        self.relation_name = relation_name
+
+        super().__init__(charm, "rolling-restart")
+        self.framework.observe(charm.on.leader_elected, self._on_changed)
+        self.framework.observe(
+            charm.on[self.relation_name].relation_changed, self._on_changed
+        )
+        self.framework.observe(
+            charm.on[self.relation_name].relation_departed, self._on_changed
+        )
+        self.charm = charm
+
+    @property
+    def _relation(self):
+        """The peer relation."""
+        return self.charm.model.get_relation(self.relation_name)
+
+    def request(self, action="requested"):
+        """Ask for this unit to be restarted.
+
+        Args:
+            action: `requested` for a plain restart, `compact` to compact
+                the database or `seed` to load the leader's snapshot while
+                the service is stopped.
+
+        Returns:
+            The restart results if the unit restarted right away, None if
+            it is queued.
+        """
+        databag = self._relation.data[self.charm.unit]
+        # Pending offline work already includes a restart.
+        if databag.get("restart", "requested") == "requested":
+            databag["restart"] = action
+
+        results = self._process()
+        if results is None:
+            self.charm.unit.status = WaitingStatus("waiting to restart")
+        return results
+
+    @log_event_handler(logger)
+    def _on_changed(self, event):
+        """Grant the lock or restart if this unit holds it.
+
+        Args:
+            event: leader elected or peer relation event.
+        """
+        if not self._relation:
+            return
+
+        # Failing the hook would roll the released restart lock back and
+        # restart the unit again when the hook is retried.
+        try:
+            self._process()
+        except (ExecError, TimeoutError) as e:
+            logger.error(f"restart failed: {e}")
+
+    def _process(self):
+        """Advance the restart queue.
+
+        Returns:
+            The restart results if this unit restarted, None otherwise.
+        """
+        if self.charm.unit.is_leader():
+            self._grant()
+
+        databag = self._relation.data[self.charm.unit]
+        request = databag.get("restart")
+        if self.charm._state.restart_granted != self.charm.unit.name or (
+            not request
+        ):
+            return None
+
+        # The lock is released even when the restart fails so that a broken
+        # unit does not hold the other ones back. Callers must not fail the
+        # hook, or Juju discards the release.
+        try:
+            results = self._restart(request)
+        except (ExecError, TimeoutError):
+            self.charm.unit.status = BlockedStatus("openldap restart failed")
+            raise
+        finally:
+            del databag["restart"]
+            if self.charm.unit.is_leader():
+                self._grant()
+
+        if request == "compact":
+            logger.info(f"database compacted: {results}")
+        return results
+
+    def _grant(self):
+        """Hand the restart lock to the next unit that asked for it."""
+        relation = self._relation
+        waiting = sorted(
+            (
+                unit
+                for unit in {self.charm.unit, *relation.units}
+                if relation.data[unit].get("restart")
+            ),
+            key=lambda unit: int(unit.name.split("/")[-1]),
+        )
+        granted = self.charm._state.restart_granted
+        if granted in [unit.name for unit in waiting]:
+            return
+
+        next_unit = waiting[0].name if waiting else None
+        if next_unit != granted:
+            self.charm._state.restart_granted = next_unit
+
+    def _restart(self, action):
+        """Drain, restart and warm the workload up until it is ready again.
+
+        Args:
+            action: the restart request, see `request`.
+
+        Returns:
+            The downtime and warm-up durations, and the database sizes when
+            compacting.
+        """
+        container = self.charm.unit.get_container(self.charm.name)
+
+        # Draining only helps when other units can take the clients over.
+        if self._relation.units:
+            period = self.charm.config["restart-drain-period"]
+            self.charm.unit.status = MaintenanceStatus("draining")
+            container.push(DRAIN_MARKER, "", make_dirs=True)
+            time.sleep(period)
+
+        results = {}
+        try:
+            stopped = time.monotonic()
+            if action == "compact":
+                results = self._compact(container)
+            elif action == "seed":
+                self.charm.peer.seed(container)
+            else:
+                self.charm.unit.status = MaintenanceStatus(
+                    "restarting openldap"
+                )
+                container.restart(self.charm.name)
+            slapd.wait_until_running(container)
+            started = time.monotonic()
+            self.charm.warm_up(container)
+        finally:
+            if container.exists(DRAIN_MARKER):
+                container.remove_path(DRAIN_MARKER)
+
+        # The unit only reports ready again once warm-up is over.
+        ready = time.monotonic()
+        self.charm.unit.status = ActiveStatus()
+        results["downtime-seconds"] = round(ready - stopped, 2)
+        results["warmup-seconds"] = round(ready - started, 2)
+        return results
+
+    def _compact(self, container):
+        """Compact the database while the service is stopped.
+
+        Args:
+            container: OpenLDAP container.
+
+        Returns:
+            The database sizes before and after compaction.
+        """
+        self.charm.unit.status = MaintenanceStatus("compacting database")
+        size_before = slapd.file_size(container, f"{DATA_DIR}/data.mdb")
+        container.stop(self.charm.name)
+        try:
+            slapd.compact(container, DATA_DIR, COMPACT_DIR)
+        finally:
+            container.start(self.charm.name)
+        size_after = slapd.file_size(container, f"{DATA_DIR}/data.mdb")
+        return {
+            "size-before": size_before,
+            "size-after": size_after,
+            "bytes-reclaimed": size_before - size_after,
+        }
@@ -0,0 +1,1331 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Helpers for driving slapd and its tools inside the workload container."""
+
+import base64
+import logging
+import re
+import shlex
+import time
+
+from ops.pebble import ChangeError, ExecError
+
+from literals import (
+    ACCESSLOG_BASE,
+    ACCESSLOG_DIR,
+    CONFIG_DIR,
+    DATA_DIR,
+    DRAIN_MARKER,
+    LDAPI_URL,
+    LOCAL_URL,
+    PCACHE_DIR,
+    SEARCH_PAGE_SIZE,
+    SNAPSHOT_ATTRIBUTES,
+    SUBTREE_DIR,
+    SUBTREE_RID_STEP,
+    WARM_MARKER,
+    WARMUP_MAX_PASSES,
+    WARMUP_STEADY_RATIO,
+    WARMUP_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# cn=config is only writable by root over the local unix socket.
+CONFIG_AUTH = ["-Y", "EXTERNAL", "-Q", "-H", LDAPI_URL]
+
+# Anonymous clients would otherwise read the remote directory with the
+# rights of the proxy's bind identity.
+PROXY_ACCESS = "to * by users read by * none"
+
+# Exit codes of the ldap client tools.
+LDAP_SIZELIMIT_EXCEEDED = 4
+LDAP_NO_SUCH_OBJECT = 32
+
+WARM_TEST = (
+    f"test -s {WARM_MARKER}"
+    f' && test "$(cat {WARM_MARKER})" = "$(pidof slapd)"'
+)
+
+
+def run(container, command, stdin=None, timeout=None):
+    """Run a command in the container and return its output.
+
+    Args:
+        container: OpenLDAP container.
+        command: command and arguments to run.
+        stdin: optional data to feed to the command.
+        timeout: optional timeout in seconds.
+
+    Returns:
+        Standard output of the command.
+
+    Raises:
+        ExecError: in case the command fails.
+    """
+    try:
+        stdout, _ = container.exec(
+            command, stdin=stdin, timeout=timeout
+        ).wait_output()
+    except ExecError as e:
+        logger.error(e.stderr)
+        raise
+    return stdout
+
+
+def run_shell(container, script, timeout=None):
+    """Run a shell snippet in the container and return its output.
+
+    Args:
+        container: OpenLDAP container.
+        script: shell snippet, arguments must already be quoted.
+        timeout: optional timeout in seconds.
+
+    Returns:
+        Standard output of the snippet.
+    """
+    return run(container, ["sh", "-c", script], timeout=timeout)
+
+
+def admin_auth(url, base_dn, password):
+    """Build ldap client arguments binding as the admin user.
+
+    Args:
+        url: LDAP URL of the server.
+        base_dn: base DN under which the admin user lives.
+        password: admin password.
+
+    Returns:
+        List of command line arguments.
+    """
+    return ["-x", "-H", url, "-D", f"cn=admin,{base_dn}", "-w", password]
+
+
+def _unfold(text):
+    """Join LDIF continuation lines with the line they continue.
+
+    Args:
+        text: LDIF document.
+
+    Returns:
+        List of logical LDIF lines.
+    """
+    lines = []
+    for line in text.splitlines():
+        if line.startswith(" ") and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+    return lines
+
+
+def _decode_value(line, value):
+    """Decode the value part of an LDIF attribute line.
+
+    Args:
+        line: the whole LDIF line, for error messages.
+        value: the part of the line following the first colon.
+
+    Returns:
+        The attribute value, as bytes for base64 values that are not UTF-8
+        text.
+
+    Raises:
+        ValueError: in case of unsupported values.
+    """
+    if value.startswith(":"):
+        decoded = base64.b64decode(value[1:].strip())
+        try:
+            return decoded.decode()
+        except UnicodeDecodeError:
+            return decoded
+    if value.startswith("<"):
+        raise ValueError(f"URL values are not supported: {line!r}")
+    return value.strip()
+
+
+def parse_ldif(text):
+    """Parse LDIF content records.
+
+    Args:
+        text: LDIF document.
+
+    Returns:
+        List of (dn, attributes) tuples where attributes maps each
+        attribute name to its list of values. Binary values are bytes.
+
+    Raises:
+        ValueError: in case of malformed or unsupported LDIF.
+    """
+    entries = []
+    dn, attributes = None, {}
+    for line in _unfold(text) + [""]:
+        if not line.strip():
+            if dn is not None:
+                entries.append((dn, attributes))
+            dn, attributes = None, {}
+            continue
+        if line.startswith("#"):
+            continue
+
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise ValueError(f"malformed LDIF line: {line!r}")
+        value = _decode_value(line, value)
+
+        if name.lower() == "version" and dn is None:
+            continue
+        if name.lower() == "dn":
+            if isinstance(value, bytes):
+                raise ValueError(f"dn is not UTF-8 text: {line!r}")
+            dn = value
+        elif dn is None:
+            raise ValueError(f"LDIF record without dn: {line!r}")
+        else:
+            attributes.setdefault(name, []).append(value)
+    return entries
+
+
+def to_ldif_lines(attributes):
+    """Render attributes as LDIF lines.
+
+    Args:
+        attributes: mapping of attribute names to a value or list of values.
+
+    Returns:
+        List of `name: value` lines.
+    """
+    lines = []
+    for name, values in attributes.items():
+        if not isinstance(values, list):
+            values = [values]
+        lines += [f"{name}: {value}" for value in values]
+    return lines
+
+
+def ldif_line(name, value):
+    """Render one LDIF attribute line, base64-encoding unsafe values.
+
+    Args:
+        name: attribute name.
+        value: attribute value, text or bytes.
+
+    Returns:
+        The LDIF line.
+    """
+    if isinstance(value, bytes):
+        return f"{name}:: {base64.b64encode(value).decode()}"
+
+    unsafe = (
+        not value.isascii()
+        or value[:1] in (" ", ":", "<")
+        or value.endswith(" ")
+        or "\n" in value
+        or "\r" in value
+    )
+    if unsafe:
+        return f"{name}:: {base64.b64encode(value.encode()).decode()}"
+    return f"{name}: {value}"
+
+
+def normalize_dn(dn):
+    """Normalize a DN for comparison.
+
+    Args:
+        dn: distinguished name.
+
+    Returns:
+        Lower-case DN without spaces around RDN separators.
+    """
+    return ",".join(rdn.strip() for rdn in dn.split(",")).lower()
+
+
+def diff_entries(current, desired, delete=False, keep=()):
+    """Compute the LDIF change records turning current into desired entries.
+
+    Only the attributes listed in a desired entry are managed, others are
+    left untouched. Adds are ordered parents first and deletes children
+    first so that each batch can be applied in sequence.
+
+    Args:
+        current: list of (dn, attributes) tuples read from the server.
+        desired: list of (dn, attributes) tuples of the desired state.
+        delete: whether to delete current entries missing from desired,
+            other than their ancestors.
+        keep: DNs never deleted.
+
+    Returns:
+        Tuple of the add, modify and delete change records.
+    """
+    existing = {
+        normalize_dn(dn): {
+            name.lower(): set(values) for name, values in attributes.items()
+        }
+        for dn, attributes in current
+    }
+
+    def depth(dn):
+        return normalize_dn(dn).count(",")
+
+    adds, modifies = [], []
+    for dn, attributes in sorted(desired, key=lambda entry: depth(entry[0])):
+        have = existing.get(normalize_dn(dn))
+        if have is None:
+            lines = [ldif_line("dn", dn), "changetype: add"]
+            for name, values in attributes.items():
+                lines += [ldif_line(name, value) for value in values]
+            adds.append("\n".join(lines) + "\n")
+            continue
+
+        lines = []
+        for name, values in attributes.items():
+            if set(values) != have.get(name.lower(), set()):
+                lines.append(f"replace: {name}")
+                lines += [ldif_line(name, value) for value in values]
+                lines.append("-")
+        if lines:
+            modifies.append(
+                "\n".join([ldif_line("dn", dn), "changetype: modify", *lines])
+                + "\n"
+            )
+
+    deletes = []
+    if delete:
+        # Ancestors of desired entries cannot be deleted before them.
+        wanted = set()
+        for dn, _ in desired:
+            rdns = normalize_dn(dn).split(",")
+            wanted |= {",".join(rdns[i:]) for i in range(len(rdns))}
+        wanted |= {normalize_dn(dn) for dn in keep}
+        stale = [dn for dn, _ in current if normalize_dn(dn) not in wanted]
+        deletes = [
+            f"{ldif_line('dn', dn)}\nchangetype: delete\n"
+            for dn in sorted(stale, key=depth, reverse=True)
+        ]
+    return adds, modifies, deletes
+
+
+def is_running(container):
+    """Report whether slapd answers on its local socket.
+
+    Args:
+        container: OpenLDAP container.
+
+    Returns:
+        A boolean stating whether slapd is serving requests.
+    """
+    try:
+        container.exec(["ldapwhoami", *CONFIG_AUTH]).wait_output()
+    except ExecError:
+        return False
+    return True
+
+
+def is_warm(container):
+    """Report whether the running slapd process went through warm-up.
+
+    Args:
+        container: OpenLDAP container.
+
+    Returns:
+        A boolean stating whether the warm-up marker names the running
+        slapd process.
+    """
+    try:
+        container.exec(["sh", "-c", WARM_TEST]).wait_output()
+    except ExecError:
+        return False
+    return True
+
+
+def ready_command():
+    """Build the pebble readiness check command.
+
+    A unit is ready once slapd answers, went through warm-up and is not
+    draining ahead of a restart.
+
+    Returns:
+        The check command.
+    """
+    return (
+        f"sh -c 'test ! -e {DRAIN_MARKER} && {WARM_TEST}"
+        f" && ldapwhoami {shlex.join(CONFIG_AUTH)}'"
+    )
+
+
+def warm_up(
+    container, base_dn, password, searches, read_ahead=True, size_limit=0
+):
+    """Prime the page cache and mark the running slapd process as warm.
+
+    The MDB files are read ahead, then the priming searches are repeated
+    until a pass is no longer noticeably faster than the previous one.
+    Warm-up is cut short after `WARMUP_TIMEOUT` seconds or when a priming
+    search fails, the process is marked as warm regardless.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix searched by the priming searches.
+        password: admin password.
+        searches: LDAP filters of the priming searches.
+        read_ahead: whether to read the MDB files into the page cache.
+        size_limit: maximum number of entries returned by each priming
+            search, 0 for no limit.
+
+    Returns:
+        Warm-up duration in seconds.
+    """
+    start = time.monotonic()
+    deadline = start + WARMUP_TIMEOUT
+
+    limit = ["-z", str(size_limit)] if size_limit else []
+    commands = [
+        "{ "
+        + shlex.join(
+            [
+                "ldapsearch",
+                *admin_auth(LOCAL_URL, base_dn, password),
+                "-LLL",
+                *limit,
+                "-E",
+                f"pr={SEARCH_PAGE_SIZE}/noprompt",
+                "-b",
+                base_dn,
+                search,
+            ]
+        )
+        + f" > /dev/null || test $? -eq {LDAP_SIZELIMIT_EXCEEDED}; }}"
+        for search in searches
+    ]
+    try:
+        if read_ahead:
+            run_shell(
+                container,
+                f"find {shlex.quote(DATA_DIR)} -name data.mdb"
+                " -exec cat {} + > /dev/null",
+                timeout=WARMUP_TIMEOUT,
+            )
+
+        previous = None
+        for _ in range(WARMUP_MAX_PASSES if commands else 0):
+            started = time.monotonic()
+            if started >= deadline:
+                break
+            run_shell(
+                container, " && ".join(commands), timeout=deadline - started
+            )
+            elapsed = time.monotonic() - started
+            if previous is not None and (
+                elapsed > previous * WARMUP_STEADY_RATIO
+            ):
+                break
+            previous = elapsed
+    except ChangeError as e:
+        logger.warning(f"warm-up cut short: {e.err}")
+    except ExecError as e:
+        logger.warning(f"warm-up cut short: {e.stderr}")
+
+    run_shell(container, f"pidof slapd > {shlex.quote(WARM_MARKER)}")
+    return time.monotonic() - start
+
+
+def wait_until_running(container, timeout=60):
+    """Wait for slapd to answer on its local socket.
+
+    Args:
+        container: OpenLDAP container.
+        timeout: maximum number of seconds to wait.
+
+    Raises:
+        TimeoutError: if slapd does not come up in time.
+    """
+    deadline = time.monotonic() + timeout
+    while not is_running(container):
+        if time.monotonic() > deadline:
+            raise TimeoutError("slapd did not start in time")
+        time.sleep(1)
+
+
+def search_config(container, base, search_filter, attributes, scope="sub"):
+    """Search cn=config.
+
+    Args:
+        container: OpenLDAP container.
+        base: search base.
+        search_filter: LDAP filter.
+        attributes: attributes to return.
+        scope: search scope.
+
+    Returns:
+        List of (dn, attributes) tuples.
+    """
+    stdout = run(
+        container,
+        [
+            "ldapsearch",
+            *CONFIG_AUTH,
+            "-LLL",
+            "-o",
+            "ldif-wrap=no",
+            "-s",
+            scope,
+            "-b",
+            base,
+            search_filter,
+            *attributes,
+        ],
+    )
+    return parse_ldif(stdout)
+
+
+def modify_config(container, ldif):
+    """Apply an LDIF change set to cn=config.
+
+    Args:
+        container: OpenLDAP container.
+        ldif: LDIF change records.
+    """
+    run(container, ["ldapmodify", *CONFIG_AUTH], stdin=ldif)
+
+
+def database_dn(container, suffix):
+    """Find the cn=config entry of the database serving a suffix.
+
+    Args:
+        container: OpenLDAP container.
+        suffix: suffix of the database.
+
+    Returns:
+        DN of the database configuration entry.
+
+    Raises:
+        LookupError: if no database serves the suffix.
+    """
+    entries = search_config(
+        container, "cn=config", f"(olcSuffix={suffix})", ["dn"], "one"
+    )
+    if not entries:
+        raise LookupError(f"no database serves {suffix}")
+    return entries[0][0]
+
+
+def database_index(db_dn):
+    """Read the ordering index of a database configuration entry.
+
+    Args:
+        db_dn: DN of the database configuration entry.
+
+    Returns:
+        The index between braces, e.g. 1 for `olcDatabase={1}mdb,cn=config`.
+
+    Raises:
+        ValueError: if the DN carries no index.
+    """
+    match = re.match(r"olcDatabase=\{(-?\d+)\}", db_dn)
+    if not match:
+        raise ValueError(f"no database index in {db_dn}")
+    return int(match.group(1))
+
+
+def ensure_module(container, module):
+    """Load a dynamic module unless it is already loaded.
+
+    Args:
+        container: OpenLDAP container.
+        module: name of the module, e.g. `syncprov`.
+    """
+    entries = search_config(
+        container,
+        "cn=config",
+        "(objectClass=olcModuleList)",
+        ["olcModuleLoad"],
+        "one",
+    )
+    for _, attributes in entries:
+        for loaded in attributes.get("olcModuleLoad", []):
+            if loaded.split("}")[-1].split(".")[0] == module:
+                return
+
+    dn = entries[0][0]
+    modify_config(
+        container,
+        f"dn: {dn}\nchangetype: modify\nadd: olcModuleLoad\n"
+        f"olcModuleLoad: {module}\n",
+    )
+
+
+def ensure_overlay(container, db_dn, overlay, object_class, attributes):
+    """Add an overlay to a database unless it is already configured.
+
+    Args:
+        container: OpenLDAP container.
+        db_dn: DN of the database configuration entry.
+        overlay: name of the overlay.
+        object_class: configuration object class of the overlay.
+        attributes: overlay configuration attributes, values may be lists.
+
+    Returns:
+        DN of the overlay configuration entry.
+    """
+    entries = search_config(
+        container, db_dn, f"(olcOverlay=*{overlay})", ["dn"], "one"
+    )
+    if entries:
+        return entries[0][0]
+
+    ensure_module(container, overlay)
+    lines = [
+        f"dn: olcOverlay={overlay},{db_dn}",
+        "changetype: add",
+        "objectClass: olcOverlayConfig",
+        f"objectClass: {object_class}",
+        f"olcOverlay: {overlay}",
+    ]
+    lines += to_ldif_lines(attributes)
+    modify_config(container, "\n".join(lines) + "\n")
+
+    # slapd prefixes the RDN with the overlay's position in the stack.
+    entries = search_config(
+        container, db_dn, f"(olcOverlay=*{overlay})", ["dn"], "one"
+    )
+    return entries[0][0]
+
+
+def context_csn(container, url, base_dn, password):
+    """Read the contextCSN of a replicated suffix.
+
+    Args:
+        container: OpenLDAP container.
+        url: LDAP URL of the server to query.
+        base_dn: replicated suffix.
+        password: admin password.
+
+    Returns:
+        The most recent contextCSN value, or None if it is not set yet.
+    """
+    stdout = run(
+        container,
+        [
+            "ldapsearch",
+            *admin_auth(url, base_dn, password),
+            "-LLL",
+            "-s",
+            "base",
+            "-b",
+            base_dn,
+            "(objectClass=*)",
+            "contextCSN",
+        ],
+    )
+    for _, attributes in parse_ldif(stdout):
+        values = attributes.get("contextCSN")
+        if values:
+            return max(values)
+    return None
+
+
+def dump_snapshot(container, url, base_dn, password, path):
+    """Stream a snapshot of a remote suffix into a local LDIF file.
+
+    The whole tree is fetched by a single search operation, which back-mdb
+    serves from one read transaction, so the snapshot is consistent.
+
+    Args:
+        container: OpenLDAP container.
+        url: LDAP URL of the server holding the snapshot.
+        base_dn: suffix to snapshot.
+        password: admin password.
+        path: destination file in the container.
+    """
+    command = [
+        "ldapsearch",
+        *admin_auth(url, base_dn, password),
+        "-LLL",
+        "-o",
+        "ldif-wrap=no",
+        "-b",
+        base_dn,
+        "(objectClass=*)",
+        *SNAPSHOT_ATTRIBUTES,
+    ]
+    run_shell(container, f"{shlex.join(command)} > {shlex.quote(path)}")
+
+
+def load_snapshot(container, base_dn, path):
+    """Replace the local database of a suffix with a snapshot, offline.
+
+    slapd must be stopped. Every database under the data directory is
+    emptied, so that entries of glued subtrees are loaded into their own
+    database. `-w` rebuilds contextCSN from the loaded entries so that
+    syncrepl resumes from the snapshot instead of starting over.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix to load.
+        path: snapshot LDIF file in the container.
+    """
+    data_dir = shlex.quote(DATA_DIR)
+    command = [
+        "slapadd",
+        "-q",
+        "-w",
+        "-F",
+        CONFIG_DIR,
+        "-b",
+        base_dn,
+        "-l",
+        path,
+    ]
+    run_shell(
+        container,
+        f"find {data_dir} -name '*.mdb' -delete"
+        f" && {shlex.join(command)}"
+        f" && chown -R openldap:openldap {data_dir}",
+    )
+
+
+def syncrepl_directive(rid, provider, base_dn, password, **options):
+    """Build an olcSyncrepl value consuming a suffix from a provider.
+
+    Args:
+        rid: replica ID, unique per consumer database.
+        provider: LDAP URL of the provider.
+        base_dn: replicated suffix.
+        password: admin password on the provider.
+        options: extra syncrepl parameters overriding the defaults.
+
+    Returns:
+        The olcSyncrepl value.
+    """
+    params = {
+        "rid": f"{rid:03d}",
+        "provider": provider,
+        "bindmethod": "simple",
+        "binddn": f'"cn=admin,{base_dn}"',
+        "credentials": password,
+        "searchbase": f'"{base_dn}"',
+        "scope": "sub",
+        "schemachecking": "off",
+        "type": "refreshAndPersist",
+        "retry": '"30 +"',
+    }
+    params.update(options)
+    return " ".join(f"{key}={value}" for key, value in params.items())
+
+
+def follow(container, db_dn, directive, provider):
+    """Make a database consume from a provider and refer writes to it.
+
+    Nothing is changed if the database already follows the provider, which
+    avoids restarting the replication session on every hook.
+
+    Args:
+        container: OpenLDAP container.
+        db_dn: DN of the database configuration entry.
+        directive: olcSyncrepl value.
+        provider: LDAP URL of the provider.
+    """
+    entries = search_config(
+        container, db_dn, "(objectClass=*)", ["olcSyncrepl"], "base"
+    )
+    current = entries[0][1].get("olcSyncrepl", []) if entries else []
+    wanted = set(shlex.split(directive))
+    for value in current:
+        # slapd echoes the directive back with its own defaults added.
+        if wanted <= set(shlex.split(value.split("}", 1)[-1])):
+            return
+
+    modify_config(
+        container,
+        f"dn: {db_dn}\nchangetype: modify\n"
+        f"replace: olcSyncrepl\nolcSyncrepl: {directive}\n-\n"
+        f"replace: olcUpdateRef\nolcUpdateRef: {provider}\n",
+    )
+
+
+def unfollow(container, db_dn):
+    """Stop consuming from a provider and accept writes locally.
+
+    Args:
+        container: OpenLDAP container.
+        db_dn: DN of the database configuration entry.
+    """
+    modify_config(
+        container,
+        f"dn: {db_dn}\nchangetype: modify\n"
+        "replace: olcUpdateRef\n-\nreplace: olcSyncrepl\n",
+    )
+
+
+def tree_databases(container, base_dn):
+    """List the database serving a suffix and the subtrees glued under it.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix of the main database.
+
+    Returns:
+        List of (database DN, suffix) tuples, the main database first.
+    """
+    suffix = normalize_dn(base_dn)
+    databases = [(database_dn(container, base_dn), base_dn)]
+    for dn, attributes in search_config(
+        container, "cn=config", "(olcSubordinate=TRUE)", ["olcSuffix"], "one"
+    ):
+        databases += [
+            (dn, value)
+            for value in attributes.get("olcSuffix", [])
+            if normalize_dn(value).endswith(f",{suffix}")
+        ]
+    return databases
+
+
+def follow_tree(
+    container, base_dn, rid, provider, password, refer=None, **options
+):
+    """Make a suffix and its glued subtrees consume from a provider.
+
+    Writes go to the database serving their DN, so every subtree database
+    needs its own consumer and referral. Subtree consumers use `rid` plus
+    a multiple of `SUBTREE_RID_STEP` as replica ID.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix of the main database.
+        rid: replica ID of the main database consumer.
+        provider: LDAP URL of the provider.
+        password: admin password on the provider.
+        refer: URL writes are referred to, defaults to the provider.
+        options: extra syncrepl parameters.
+    """
+    for step, (db_dn, suffix) in enumerate(
+        tree_databases(container, base_dn)
+    ):
+        directive = syncrepl_directive(
+            rid + step * SUBTREE_RID_STEP,
+            provider,
+            base_dn,
+            password,
+            searchbase=f'"{suffix}"',
+            **options,
+        )
+        follow(container, db_dn, directive, refer or provider)
+
+
+def unfollow_tree(container, base_dn):
+    """Stop a suffix and its glued subtrees consuming from a provider.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix of the main database.
+    """
+    for db_dn, _ in tree_databases(container, base_dn):
+        unfollow(container, db_dn)
+
+
+def ensure_tree_provider(container, base_dn):
+    """Enable syncprov on a suffix and the subtrees glued under it.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix of the main database.
+    """
+    for db_dn, _ in tree_databases(container, base_dn):
+        ensure_provider(container, db_dn)
+
+
+def ensure_provider(container, db_dn):
+    """Enable the syncprov overlay so that a database can be replicated.
+
+    Args:
+        container: OpenLDAP container.
+        db_dn: DN of the database configuration entry.
+    """
+    ensure_overlay(
+        container,
+        db_dn,
+        "syncprov",
+        "olcSyncProvConfig",
+        {"olcSpCheckpoint": "100 10", "olcSpSessionlog": "1000"},
+    )
+
+
+def file_size(container, path):
+    """Return the size of a file in the container.
+
+    Args:
+        container: OpenLDAP container.
+        path: file path.
+
+    Returns:
+        Size of the file in bytes.
+    """
+    return int(run(container, ["stat", "-c", "%s", path]).strip())
+
+
+def db_stats(container, data_dir):
+    """Report environment and freelist statistics of an MDB database.
+
+    Args:
+        container: OpenLDAP container.
+        data_dir: directory holding the MDB environment.
+
+    Returns:
+        Dictionary with map size, page size, used and free pages, file size
+        and the fraction of used pages sitting in the freelist.
+    """
+    stdout = run(container, ["mdb_stat", "-ef", data_dir])
+    raw = {}
+    for line in stdout.splitlines():
+        key, sep, value = line.strip().partition(":")
+        if sep and value.strip().isdigit():
+            raw[key.lower()] = int(value)
+
+    used_pages = raw.get("number of pages used", 0)
+    free_pages = raw.get("free pages", 0)
+    return {
+        "map-size": raw.get("map size", 0),
+        "page-size": raw.get("page size", 0),
+        "used-pages": used_pages,
+        "free-pages": free_pages,
+        "file-size": file_size(container, f"{data_dir}/data.mdb"),
+        "fragmentation": round(free_pages / used_pages, 4)
+        if used_pages
+        else 0.0,
+    }
+
+
+def compact(container, data_dir, work_dir):
+    """Rewrite an MDB database without its free pages, offline.
+
+    slapd must be stopped.
+
+    Args:
+        container: OpenLDAP container.
+        data_dir: directory holding the MDB environment.
+        work_dir: scratch directory on the same filesystem.
+    """
+    data_dir, work_dir = shlex.quote(data_dir), shlex.quote(work_dir)
+    run_shell(
+        container,
+        f"rm -rf {work_dir} && mkdir -p {work_dir}"
+        f" && mdb_copy -c {data_dir} {work_dir}"
+        f" && mv {work_dir}/data.mdb {data_dir}/data.mdb"
+        f" && rm -rf {work_dir} {data_dir}/lock.mdb"
+        f" && chown -R openldap:openldap {data_dir}",
+    )
+
+
+def add_database(
+    container, suffix, backend, attributes, directory=None, before=None
+):
+    """Add a database serving a suffix unless one already does.
+
+    Args:
+        container: OpenLDAP container.
+        suffix: suffix of the database.
+        backend: backend type, e.g. `mdb` or `ldap`.
+        attributes: extra configuration attributes, values may be lists.
+        directory: data directory to create for the database, if any.
+        before: DN of the database configuration entry to insert the new
+            database in front of, rather than appending it.
+
+    Returns:
+        DN of the database configuration entry.
+    """
+    try:
+        return database_dn(container, suffix)
+    except LookupError:
+        pass
+
+    if backend != "mdb":
+        ensure_module(container, f"back_{backend}")
+    if directory:
+        path = shlex.quote(directory)
+        run_shell(
+            container,
+            f"mkdir -p {path} && chown -R openldap:openldap {path}",
+        )
+        attributes = {"olcDbDirectory": directory, **attributes}
+
+    # slapd renumbers the databases following an explicit index.
+    database = backend
+    if before:
+        database = f"{{{database_index(before)}}}{backend}"
+
+    object_class = "olcMdbConfig" if backend == "mdb" else "olcLDAPConfig"
+    lines = [
+        f"dn: olcDatabase={database},cn=config",
+        "changetype: add",
+        "objectClass: olcDatabaseConfig",
+        f"objectClass: {object_class}",
+        f"olcDatabase: {database}",
+        f"olcSuffix: {suffix}",
+    ]
+    lines += to_ldif_lines(attributes)
+    modify_config(container, "\n".join(lines) + "\n")
+    return database_dn(container, suffix)
+
+
+def configure_proxy(container, suffix, uri, cache, bind):
+    """Serve a remote directory through back-ldap and the pcache overlay.
+
+    pcache cannot change its cache database or drop templates at runtime,
+    so existing caches only get their remote URI and bind identity updated
+    and templates that are missing added. Requests that are not bound to
+    the remote directory, cache refreshes included, are sent as the bind
+    identity, so only authenticated clients may read the proxied suffix.
+
+    Args:
+        container: OpenLDAP container.
+        suffix: suffix of the remote directory.
+        uri: LDAP URL of the remote directory.
+        cache: dictionary with the cache `templates`, `ttl`, `attributes`
+            and `max_entries`.
+        bind: dictionary with the `dn` and `password` used on the remote
+            directory.
+    """
+    idassert = (
+        f'bindmethod=simple binddn="{bind["dn"]}" '
+        f'credentials="{bind["password"]}" mode=none'
+    )
+    db_dn = add_database(
+        container,
+        suffix,
+        "ldap",
+        {
+            "olcDbURI": uri,
+            "olcDbIDAssertBind": idassert,
+            "olcAccess": PROXY_ACCESS,
+        },
+    )
+    entries = search_config(
+        container,
+        db_dn,
+        "(objectClass=*)",
+        ["olcDbURI", "olcDbIDAssertBind", "olcAccess"],
+        "base",
+    )
+    attributes = entries[0][1]
+    if uri not in attributes.get("olcDbURI", []):
+        modify_config(
+            container,
+            f"dn: {db_dn}\nchangetype: modify\nreplace: olcDbURI\n"
+            f"olcDbURI: {uri}\n",
+        )
+
+    # slapd spells the other idassert options out when reading them back.
+    configured = " ".join(attributes.get("olcDbIDAssertBind", []))
+    if f'binddn="{bind["dn"]}"' not in configured or (
+        f'credentials="{bind["password"]}"' not in configured
+    ):
+        modify_config(
+            container,
+            f"dn: {db_dn}\nchangetype: modify\n"
+            f"replace: olcDbIDAssertBind\nolcDbIDAssertBind: {idassert}\n",
+        )
+
+    # Access rules are read back with their ordering prefix.
+    access = [
+        re.sub(r"^\{\d+\}", "", rule)
+        for rule in attributes.get("olcAccess", [])
+    ]
+    if access != [PROXY_ACCESS]:
+        modify_config(
+            container,
+            f"dn: {db_dn}\nchangetype: modify\n"
+            f"replace: olcAccess\nolcAccess: {PROXY_ACCESS}\n",
+        )
+
+    templates = [
+        f"{template} 0 {cache['ttl']}" for template in cache["templates"]
+    ]
+    overlay_dn = ensure_overlay(
+        container,
+        db_dn,
+        "pcache",
+        "olcPcacheConfig",
+        {
+            "olcPcache": f"mdb {cache['max_entries']} 1 1000 100",
+            "olcPcacheAttrset": f"0 {cache['attributes']}",
+            "olcPcacheTemplate": templates,
+        },
+    )
+
+    entries = search_config(
+        container, overlay_dn, "(objectClass=*)", ["olcPcacheTemplate"], "base"
+    )
+    configured = {
+        value.split("}", 1)[-1].rsplit(")", 1)[0]
+        for value in entries[0][1].get("olcPcacheTemplate", [])
+    }
+    missing = [
+        template
+        for template in templates
+        if template.rsplit(")", 1)[0] not in configured
+    ]
+    if missing:
+        modify_config(
+            container,
+            f"dn: {overlay_dn}\nchangetype: modify\nadd: olcPcacheTemplate\n"
+            + "\n".join(f"olcPcacheTemplate: {t}" for t in missing)
+            + "\n",
+        )
+
+    if not search_config(
+        container, overlay_dn, "(objectClass=olcPcacheDatabase)", ["dn"], "one"
+    ):
+        path = shlex.quote(PCACHE_DIR)
+        run_shell(
+            container,
+            f"mkdir -p {path} && chown -R openldap:openldap {path}",
+        )
+        modify_config(
+            container,
+            "\n".join(
+                [
+                    f"dn: olcDatabase=mdb,{overlay_dn}",
+                    "changetype: add",
+                    "objectClass: olcMdbConfig",
+                    "objectClass: olcPcacheDatabase",
+                    "olcDatabase: mdb",
+                    f"olcDbDirectory: {PCACHE_DIR}",
+                    "olcDbIndex: objectClass eq",
+                    "olcDbIndex: pcacheQueryID eq",
+                ]
+            )
+            + "\n",
+        )
+
+
+def configure_accesslog(container, base_dn):
+    """Log successful writes to cn=accesslog for delta-syncrepl consumers.
+
+    Writes to the subtrees glued under the suffix are logged as well.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix whose writes are logged.
+    """
+    admin = f"cn=admin,{base_dn}"
+    log_dn = add_database(
+        container,
+        ACCESSLOG_BASE,
+        "mdb",
+        {
+            "olcDbIndex": [
+                "default eq",
+                "entryCSN,objectClass,reqEnd,reqResult,reqStart eq",
+            ],
+            "olcAccess": f'to * by dn.exact="{admin}" read by * none',
+            "olcLimits": f'dn.exact="{admin}" time=unlimited size=unlimited',
+        },
+        directory=ACCESSLOG_DIR,
+    )
+    ensure_overlay(
+        container,
+        log_dn,
+        "syncprov",
+        "olcSyncProvConfig",
+        {"olcSpNoPresent": "TRUE", "olcSpReloadHint": "TRUE"},
+    )
+
+    for db_dn, _ in tree_databases(container, base_dn):
+        ensure_provider(container, db_dn)
+        ensure_overlay(
+            container,
+            db_dn,
+            "accesslog",
+            "olcAccessLogConfig",
+            {
+                "olcAccessLogDB": ACCESSLOG_BASE,
+                "olcAccessLogOps": "writes",
+                "olcAccessLogSuccess": "TRUE",
+                "olcAccessLogPurge": "07+00:00 01+00:00",
+            },
+        )
+
+
+def search_entries(container, base_dn, password, base, attributes):
+    """Read a subtree with a paged search, binding as the admin user.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix under which the admin user lives.
+        password: admin password.
+        base: search base.
+        attributes: attributes to return.
+
+    Returns:
+        List of (dn, attributes) tuples, empty if the base does not exist.
+    """
+    try:
+        stdout = run(
+            container,
+            [
+                "ldapsearch",
+                *admin_auth(LOCAL_URL, base_dn, password),
+                "-LLL",
+                "-o",
+                "ldif-wrap=no",
+                "-E",
+                f"pr={SEARCH_PAGE_SIZE}/noprompt",
+                "-b",
+                base,
+                "(objectClass=*)",
+                *(attributes or ["1.1"]),
+            ],
+        )
+    except ExecError as e:
+        if e.exit_code == LDAP_NO_SUCH_OBJECT:
+            return []
+        raise
+    return parse_ldif(stdout)
+
+
+def modify_entries(container, base_dn, password, records):
+    """Apply LDIF change records in a single ldapmodify run.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix under which the admin user lives.
+        password: admin password.
+        records: LDIF change records.
+    """
+    run(
+        container,
+        ["ldapmodify", *admin_auth(LOCAL_URL, base_dn, password)],
+        stdin="\n".join(records),
+    )
+
+
+def update_config(container, dn, attributes):
+    """Replace the attributes of a cn=config entry that differ.
+
+    Args:
+        container: OpenLDAP container.
+        dn: DN of the configuration entry.
+        attributes: mapping of attribute names to their wanted values.
+    """
+    entries = search_config(
+        container, dn, "(objectClass=*)", list(attributes), "base"
+    )
+    current = entries[0][1] if entries else {}
+    lines = []
+    for name, value in attributes.items():
+        if [str(value)] != current.get(name):
+            lines += [f"replace: {name}", f"{name}: {value}", "-"]
+    if lines:
+        modify_config(
+            container,
+            "\n".join([f"dn: {dn}", "changetype: modify", *lines]) + "\n",
+        )
+
+
+def ensure_indexes(container, db_dn, attributes, index="eq"):
+    """Index attributes of a database that are not indexed yet.
+
+    slapd builds the new indexes in the background.
+
+    Args:
+        container: OpenLDAP container.
+        db_dn: DN of the database configuration entry.
+        attributes: attribute names to index.
+        index: index type added for each missing attribute.
+    """
+    entries = search_config(
+        container, db_dn, "(objectClass=*)", ["olcDbIndex"], "base"
+    )
+    indexed = set()
+    for value in entries[0][1].get("olcDbIndex", []) if entries else []:
+        indexed |= {name.lower() for name in value.split()[0].split(",")}
+
+    missing = [name for name in attributes if name.lower() not in indexed]
+    if missing:
+        modify_config(
+            container,
+            f"dn: {db_dn}\nchangetype: modify\nadd: olcDbIndex\n"
+            + "\n".join(f"olcDbIndex: {name} {index}" for name in missing)
+            + "\n",
+        )
+
+
+def configure_sssvlv(container, base_dn, limits, attributes):
+    """Enable server-side sorting and virtual list views on a suffix.
+
+    The subtrees glued under the suffix get the same settings.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix of the database.
+        limits: dictionary with the `max` concurrent sorts, `max_keys` per
+            sort and `max_per_conn` VLV windows per connection.
+        attributes: attributes sorted listings filter on, to be indexed.
+    """
+    settings = {
+        "olcSssVlvMax": limits["max"],
+        "olcSssVlvMaxKeys": limits["max_keys"],
+        "olcSssVlvMaxPerConn": limits["max_per_conn"],
+    }
+    # Searches based in a glued subtree are served by its own database.
+    for db_dn, _ in tree_databases(container, base_dn):
+        overlay_dn = ensure_overlay(
+            container, db_dn, "sssvlv", "olcSssVlvConfig", settings
+        )
+        update_config(container, overlay_dn, settings)
+        ensure_indexes(container, db_dn, attributes)
+
+
+def configure_subtree(container, base_dn, subtree):
+    """Serve a subtree of a suffix from its own glued MDB database.
+
+    The subordinate database shares the suffix's admin and access rules
+    but has its own write lock, map size and indexes. slapd only glues a
+    subordinate configured before its superior databases, so it is
+    inserted in front of the first of them.
+
+    Args:
+        container: OpenLDAP container.
+        base_dn: suffix the subtree is glued under.
+        subtree: dictionary with the subtree `rdn`, its `maxsize` in bytes
+            and the attribute names to `index`.
+    """
+    rdn = subtree["rdn"]
+    main = search_config(
+        container,
+        database_dn(container, base_dn),
+        "(objectClass=*)",
+        ["olcRootDN", "olcAccess"],
+        "base",
+    )[0][1]
+    slug = re.sub(r"[^a-z0-9]+", "-", rdn.lower()).strip("-")
+
+    suffix = normalize_dn(f"{rdn},{base_dn}")
+    superiors = [
+        dn
+        for dn, attributes in search_config(
+            container, "cn=config", "(olcSuffix=*)", ["olcSuffix"], "one"
+        )
+        if any(
+            suffix.endswith(f",{normalize_dn(value)}")
+            for value in attributes.get("olcSuffix", [])
+        )
+    ]
+
+    db_dn = add_database(
+        container,
+        f"{rdn},{base_dn}",
+        "mdb",
+        {
+            "olcSubordinate": "TRUE",
+            "olcRootDN": main["olcRootDN"],
+            "olcAccess": main.get("olcAccess", []),
+            "olcDbIndex": "objectClass eq",
+            "olcDbMaxSize": subtree["maxsize"],
+        },
+        directory=f"{SUBTREE_DIR}/{slug}",
+        before=min(superiors, key=database_index),
+    )
+    update_config(container, db_dn, {"olcDbMaxSize": subtree["maxsize"]})
+    ensure_indexes(container, db_dn, subtree["index"])
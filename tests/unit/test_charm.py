@@ -10,11 +10,18 @@ import json
 import logging
 from unittest import TestCase, mock
 
-from ops.model import ActiveStatus, BlockedStatus
-from ops.pebble import CheckStatus
-from ops.testing import Harness
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    RelationDataContent,
+    WaitingStatus,
+)
+from ops.pebble import ChangeError, CheckStatus, ExecError
+from ops.testing import ActionFailed, Harness
 
+import slapd
 from charm import OpenLDAPK8SCharm
+from literals import DRAIN_MARKER, SEED_MARKER, SNAPSHOT_PATH
 from state import State
 
 logger = logging.getLogger(__name__)
@@ -38,6 +45,16 @@ class TestCharm(TestCase):
         self.harness.set_model_name("openldap-model")
         self.harness.add_network("10.0.0.10", endpoint="peer")
         self.harness.begin()
+
+        # slapd answers and warms up as soon as the service is (re)started.
+        for name, value in (
+            ("is_running", True),
+            ("is_warm", True),
+            ("warm_up", 0.5),
+        ):
+            patcher = mock.patch(f"slapd.{name}", return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
         logging.info("setup complete")
 
     def test_initial_plan(self):
@@ -160,6 +177,820 @@ class TestCharm(TestCase):
         assert relation_data["admin_password"]
         assert relation_data["base_dn"]
 
+    def test_update_fans_out_relation_data(self):
+        """Config changes reach every consumer, unchanged ones are skipped."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        rel_id = harness.add_relation(
+            "ldap", "ranger-usersync-k8s", app_data={"user": "admin"}
+        )
+        harness.update_config({"ldap-base-dn": "dc=foo,dc=com"})
+
+        relation_data = harness.get_relation_data(
+            rel_id, "comsys-openldap-k8s"
+        )
+        self.assertEqual(relation_data["base_dn"], "dc=foo,dc=com")
+
+        with mock.patch.object(RelationDataContent, "__setitem__") as setitem:
+            harness.charm.provider.update_all()
+        setitem.assert_not_called()
+
+    @mock.patch("slapd.configure_proxy")
+    def test_proxy_mode(self, configure_proxy):
+        """Proxy mode fronts the remote directory and is published."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        rel_id = harness.add_relation(
+            "ldap", "ranger-usersync-k8s", app_data={"user": "admin"}
+        )
+
+        harness.update_config(
+            {
+                "proxy-remote-url": "ldap://remote.example.com",
+                "proxy-base-dn": "dc=example,dc=com",
+                "proxy-cache-templates": "(uid=); (&(objectClass=)(cn=))",
+                "proxy-bind-dn": "cn=proxy,dc=example,dc=com",
+                "proxy-bind-password": "remote-secret",  # nosec
+            }
+        )
+
+        container = harness.model.unit.get_container("openldap")
+        configure_proxy.assert_called_once_with(
+            container,
+            "dc=example,dc=com",
+            "ldap://remote.example.com",
+            {
+                "templates": ["(uid=)", "(&(objectClass=)(cn=))"],
+                "ttl": 3600,
+                "attributes": "*",
+                "max_entries": 100000,
+            },
+            {"dn": "cn=proxy,dc=example,dc=com", "password": "remote-secret"},
+        )
+        relation_data = harness.get_relation_data(
+            rel_id, "comsys-openldap-k8s"
+        )
+        self.assertEqual(relation_data["base_dn"], "dc=example,dc=com")
+        self.assertEqual(
+            relation_data["bind_dn"], "cn=proxy,dc=example,dc=com"
+        )
+        self.assertEqual(relation_data["admin_password"], "remote-secret")
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+    def test_proxy_mode_overlapping_base_dn(self):
+        """Proxy mode cannot serve a suffix overlapping the local one."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        harness.update_config(
+            {
+                "proxy-remote-url": "ldap://remote.example.com",
+                "proxy-base-dn": "ou=remote,dc=canonical,dc=dev,dc=com",
+                "proxy-bind-dn": "cn=proxy,dc=example,dc=com",
+                "proxy-bind-password": "remote-secret",  # nosec
+            }
+        )
+
+        self.assertEqual(
+            harness.model.unit.status,
+            BlockedStatus("proxy-base-dn overlaps ldap-base-dn"),
+        )
+
+    @mock.patch("slapd.tree_databases")
+    @mock.patch("slapd.follow")
+    def test_replica_consumes_provider(self, follow, tree_databases):
+        """A replica consumes its provider and refers writes to it."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        tree_databases.return_value = [
+            ("olcDatabase={1}mdb,cn=config", "dc=canonical,dc=dev,dc=com")
+        ]
+        ldap_id = harness.add_relation(
+            "ldap", "ranger-usersync-k8s", app_data={"user": "admin"}
+        )
+
+        rel_id = harness.add_relation("ldap-replica", "openldap-core")
+        self.assertEqual(
+            harness.get_relation_data(rel_id, "comsys-openldap-k8s"),
+            {"replica": "true"},
+        )
+        harness.update_relation_data(
+            rel_id,
+            "openldap-core",
+            {
+                "ldap_url": "ldap://openldap-core:389",
+                "ldap_replication_url": "ldap://openldap-core-0:389",
+                "base_dn": "dc=canonical,dc=dev,dc=com",
+                "admin_password": "secret",  # nosec
+            },
+        )
+
+        container = harness.model.unit.get_container("openldap")
+        directive = follow.call_args.args[2]
+        follow.assert_called_once_with(
+            container,
+            "olcDatabase={1}mdb,cn=config",
+            directive,
+            "ldap://openldap-core:389",
+        )
+        self.assertIn("provider=ldap://openldap-core-0:389", directive)
+        self.assertIn("syncdata=accesslog", directive)
+        self.assertIn("type=refreshAndPersist", directive)
+        self.assertEqual(
+            harness.get_relation_data(ldap_id, "comsys-openldap-k8s")[
+                "ldap_write_url"
+            ],
+            "ldap://openldap-core:389",
+        )
+
+    @mock.patch("slapd.unfollow")
+    @mock.patch("slapd.tree_databases")
+    @mock.patch("slapd.follow")
+    def test_replica_relation_broken(
+        self, follow, tree_databases, unfollow
+    ):
+        """A former replica accepts writes and stops referring them."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        tree_databases.return_value = [
+            ("olcDatabase={1}mdb,cn=config", "dc=canonical,dc=dev,dc=com")
+        ]
+        ldap_id = harness.add_relation(
+            "ldap", "ranger-usersync-k8s", app_data={"user": "admin"}
+        )
+        rel_id = harness.add_relation(
+            "ldap-replica",
+            "openldap-core",
+            app_data={
+                "ldap_url": "ldap://openldap-core:389",
+                "base_dn": "dc=canonical,dc=dev,dc=com",
+                "admin_password": "secret",  # nosec
+            },
+        )
+
+        relation_data = harness.get_relation_data(
+            ldap_id, "comsys-openldap-k8s"
+        )
+        self.assertEqual(
+            relation_data["ldap_write_url"], "ldap://openldap-core:389"
+        )
+
+        harness.remove_relation(rel_id)
+
+        unfollow.assert_called_once_with(
+            harness.model.unit.get_container("openldap"),
+            "olcDatabase={1}mdb,cn=config",
+        )
+        self.assertNotIn("ldap_write_url", relation_data)
+
+    @mock.patch("relations.peer.slapd")
+    @mock.patch("slapd.tree_databases")
+    @mock.patch("slapd.follow")
+    def test_replica_leader_elected(
+        self, follow, tree_databases, peer_slapd
+    ):
+        """A new replica leader takes over following the remote provider."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        tree_databases.return_value = [
+            ("olcDatabase={1}mdb,cn=config", "dc=canonical,dc=dev,dc=com")
+        ]
+        peer_slapd.context_csn.return_value = None
+        harness.add_relation(
+            "ldap-replica",
+            "openldap-core",
+            app_data={
+                "ldap_url": "ldap://openldap-core:389",
+                "base_dn": "dc=canonical,dc=dev,dc=com",
+                "admin_password": "secret",  # nosec
+            },
+        )
+        follow.reset_mock()
+
+        harness.set_leader(False)
+        harness.set_leader(True)
+
+        follow.assert_called_once()
+        self.assertIn(
+            "provider=ldap://openldap-core:389", follow.call_args.args[2]
+        )
+        peer_slapd.unfollow_tree.assert_not_called()
+
+    def test_replica_base_dn_mismatch(self):
+        """A replica must serve the same base DN as its provider."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        rel_id = harness.add_relation("ldap-replica", "openldap-core")
+        harness.update_relation_data(
+            rel_id,
+            "openldap-core",
+            {
+                "ldap_url": "ldap://openldap-core:389",
+                "base_dn": "dc=example,dc=com",
+                "admin_password": "secret",  # nosec
+            },
+        )
+
+        self.assertEqual(
+            harness.model.unit.status,
+            BlockedStatus("ldap-base-dn differs from the replica provider"),
+        )
+
+    @mock.patch("relations.peer.slapd")
+    @mock.patch("relations.provider.socket.getfqdn")
+    @mock.patch("slapd.configure_accesslog")
+    def test_provider_enables_accesslog_for_replicas(
+        self, configure_accesslog, getfqdn, peer_slapd
+    ):
+        """Related replicas get an accesslog to run delta-syncrepl from."""
+        harness = self.harness
+        getfqdn.return_value = "openldap-0.openldap-endpoints"
+        peer_slapd.context_csn.return_value = None
+        simulate_lifecycle(harness)
+
+        rel_id = harness.add_relation("ldap", "openldap-edge")
+        harness.update_relation_data(
+            rel_id, "openldap-edge", {"replica": "true"}
+        )
+
+        container = harness.model.unit.get_container("openldap")
+        configure_accesslog.assert_called_once_with(
+            container, "dc=canonical,dc=dev,dc=com"
+        )
+        relation_data = harness.get_relation_data(
+            rel_id, "comsys-openldap-k8s"
+        )
+        self.assertTrue(relation_data["ldap_url"])
+        self.assertEqual(
+            relation_data["ldap_replication_url"],
+            "ldap://openldap-0.openldap-endpoints:389",
+        )
+
+        # A new leader logs writes for the replicas too.
+        configure_accesslog.reset_mock()
+        harness.set_leader(False)
+        harness.set_leader(True)
+        configure_accesslog.assert_called_with(
+            container, "dc=canonical,dc=dev,dc=com"
+        )
+
+    @mock.patch("relations.restart.time.sleep")
+    @mock.patch("relations.peer.slapd")
+    def test_rolling_restart(self, slapd, sleep):
+        """Units restart one at a time, after draining."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        slapd.context_csn.return_value = None
+        rel_id = harness.model.get_relation("peer").id
+        harness.add_relation_unit(rel_id, "comsys-openldap-k8s/1")
+        container = harness.model.unit.get_container("openldap")
+        container.restart = mock.Mock()
+
+        # Another unit holds the restart lock.
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": "requested"}
+        )
+        self.assertEqual(
+            harness.charm._state.restart_granted, "comsys-openldap-k8s/1"
+        )
+
+        # The config change queues the leader behind it.
+        harness.update_config({"ldap-base-dn": "dc=foo,dc=com"})
+        container.restart.assert_not_called()
+        self.assertEqual(
+            harness.model.unit.status, WaitingStatus("waiting to restart")
+        )
+
+        # Once the other unit is done, the leader drains and restarts.
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": ""}
+        )
+        sleep.assert_called_once_with(15)
+        container.restart.assert_called_once_with("openldap")
+        self.assertIsNone(harness.charm._state.restart_granted)
+        self.assertFalse(container.exists(DRAIN_MARKER))
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+    @mock.patch("relations.restart.time.sleep")
+    @mock.patch("relations.restart.slapd")
+    @mock.patch("relations.peer.slapd")
+    def test_queued_restart_failure(self, peer_slapd, slapd, sleep):
+        """A failed queued restart blocks the unit and releases the lock."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        peer_slapd.context_csn.return_value = None
+        rel_id = harness.model.get_relation("peer").id
+        harness.add_relation_unit(rel_id, "comsys-openldap-k8s/1")
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": "requested"}
+        )
+        harness.update_config({"ldap-base-dn": "dc=foo,dc=com"})
+
+        slapd.wait_until_running.side_effect = TimeoutError("not running")
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": ""}
+        )
+
+        self.assertIsNone(harness.charm._state.restart_granted)
+        self.assertNotIn(
+            "restart",
+            harness.get_relation_data(rel_id, "comsys-openldap-k8s/0"),
+        )
+        self.assertEqual(
+            harness.model.unit.status,
+            BlockedStatus("openldap restart failed"),
+        )
+
+    @mock.patch("relations.restart.slapd")
+    def test_restart_action_failure(self, slapd):
+        """A failed restart fails the action."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        slapd.wait_until_running.side_effect = TimeoutError("not running")
+
+        with self.assertRaises(ActionFailed) as failed:
+            harness.run_action("restart")
+
+        self.assertEqual(
+            failed.exception.message, "restart failed: not running"
+        )
+        self.assertIsNone(harness.charm._state.restart_granted)
+
+    @mock.patch("relations.peer.socket.getfqdn")
+    @mock.patch("relations.peer.slapd")
+    def test_peer_joined_publishes_snapshot(self, slapd, getfqdn):
+        """The leader publishes a snapshot reference when a unit joins."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        slapd.is_running.return_value = True
+        slapd.context_csn.return_value = (
+            "20240101000000.000000Z#000000#000#000000"
+        )
+        getfqdn.return_value = "openldap-0.openldap-endpoints"
+
+        rel_id = harness.model.get_relation("peer").id
+        harness.add_relation_unit(rel_id, "comsys-openldap-k8s/1")
+
+        slapd.ensure_tree_provider.assert_called_once()
+        self.assertEqual(
+            harness.charm._state.snapshot,
+            {
+                "url": "ldap://openldap-0.openldap-endpoints:389",
+                "base_dn": "dc=canonical,dc=dev,dc=com",
+                "context_csn": "20240101000000.000000Z#000000#000#000000",
+            },
+        )
+        # The leader never reloads its own data after losing leadership.
+        container = harness.model.unit.get_container("openldap")
+        self.assertTrue(container.exists(SEED_MARKER))
+
+    @mock.patch("relations.restart.time.sleep")
+    @mock.patch("relations.peer.slapd")
+    def test_peer_seeds_from_snapshot(self, slapd, sleep):
+        """A unit that was not seeded loads the snapshot, then follows it."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        slapd.is_running.return_value = True
+        slapd.context_csn.return_value = None
+        container = harness.model.unit.get_container("openldap")
+        slapd.dump_snapshot.side_effect = (
+            lambda c, url, base, pwd, path: container.push(
+                path, "", make_dirs=True
+            )
+        )
+
+        rel_id = harness.model.get_relation("peer").id
+        harness.add_relation_unit(rel_id, "comsys-openldap-k8s/1")
+        harness.set_leader(False)
+        snapshot = {
+            "url": "ldap://openldap-1.openldap-endpoints:389",
+            "base_dn": "dc=canonical,dc=dev,dc=com",
+            "context_csn": "20240101000000.000000Z#000000#000#000000",
+        }
+        container.remove_path(SEED_MARKER)
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s", {"snapshot": json.dumps(snapshot)}
+        )
+
+        # The offline load waits for the restart lock.
+        slapd.load_snapshot.assert_not_called()
+        self.assertEqual(
+            harness.get_relation_data(rel_id, "comsys-openldap-k8s/0")[
+                "restart"
+            ],
+            "seed",
+        )
+        harness.update_relation_data(
+            rel_id,
+            "comsys-openldap-k8s",
+            {"restart_granted": json.dumps("comsys-openldap-k8s/0")},
+        )
+
+        sleep.assert_called_once_with(15)
+        slapd.load_snapshot.assert_called_once_with(
+            container, snapshot["base_dn"], SNAPSHOT_PATH
+        )
+        slapd.follow_tree.assert_called_once()
+        self.assertTrue(container.exists(SEED_MARKER))
+        self.assertFalse(container.exists(SNAPSHOT_PATH))
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+        # Already seeded units only keep following the leader.
+        slapd.reset_mock()
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"ping": "1"}
+        )
+        slapd.load_snapshot.assert_not_called()
+        slapd.follow_tree.assert_called_once()
+
+    @mock.patch("slapd.run")
+    def test_db_stats_action(self, run):
+        """The db-stats action reports mdb_stat figures."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        run.side_effect = lambda container, command, **kwargs: {
+            "mdb_stat": MDB_STAT_OUTPUT,
+            "stat": "40960\n",
+        }[command[0]]
+
+        output = harness.run_action("db-stats")
+
+        self.assertEqual(
+            output.results,
+            {
+                "map-size": 1073741824,
+                "page-size": 4096,
+                "used-pages": 10,
+                "free-pages": 4,
+                "file-size": 40960,
+                "fragmentation": 0.4,
+            },
+        )
+
+    @mock.patch("relations.restart.slapd")
+    def test_compact_action(self, slapd):
+        """The compact action rewrites the database while slapd is stopped."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        container = harness.model.unit.get_container("openldap")
+        calls = mock.Mock()
+        container.stop = calls.stop
+        container.start = calls.start
+        slapd.compact = calls.compact
+        slapd.wait_until_running = calls.wait_until_running
+        slapd.file_size.side_effect = [40960, 16384]
+
+        output = harness.run_action("compact")
+
+        self.assertEqual(
+            [name for name, *_ in calls.mock_calls],
+            ["stop", "compact", "start", "wait_until_running"],
+        )
+        results = output.results
+        self.assertEqual(results["result"], "database compacted")
+        self.assertEqual(results["size-before"], 40960)
+        self.assertEqual(results["size-after"], 16384)
+        self.assertEqual(results["bytes-reclaimed"], 24576)
+        self.assertGreaterEqual(
+            results["downtime-seconds"], results["warmup-seconds"]
+        )
+        self.assertIsNone(harness.charm._state.restart_granted)
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+    @mock.patch("relations.restart.slapd")
+    def test_compact_action_failure(self, slapd):
+        """A failed compaction restarts slapd and releases the lock."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        container = harness.model.unit.get_container("openldap")
+        container.start = mock.Mock()
+        slapd.file_size.return_value = 40960
+        slapd.compact.side_effect = ExecError(
+            ["mdb_copy"], 1, "", "mdb_copy: No space left on device"
+        )
+
+        with self.assertRaises(ActionFailed) as failed:
+            harness.run_action("compact")
+
+        self.assertEqual(
+            failed.exception.message,
+            "compaction failed: mdb_copy: No space left on device",
+        )
+        container.start.assert_called_once_with("openldap")
+        self.assertIsNone(harness.charm._state.restart_granted)
+        self.assertEqual(
+            harness.model.unit.status,
+            BlockedStatus("openldap restart failed"),
+        )
+
+    @mock.patch("relations.restart.time.sleep")
+    @mock.patch("relations.peer.slapd")
+    @mock.patch("relations.restart.slapd")
+    def test_compact_action_queued(self, slapd, peer_slapd, sleep):
+        """Compaction waits for the restart lock like a restart."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        peer_slapd.context_csn.return_value = None
+        rel_id = harness.model.get_relation("peer").id
+        harness.add_relation_unit(rel_id, "comsys-openldap-k8s/1")
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": "requested"}
+        )
+        slapd.file_size.side_effect = [40960, 16384]
+
+        output = harness.run_action("compact")
+
+        self.assertEqual(output.results, {"result": "compaction queued"})
+        slapd.compact.assert_not_called()
+
+        # The leader drains and compacts once the other unit is done.
+        harness.update_relation_data(
+            rel_id, "comsys-openldap-k8s/1", {"restart": ""}
+        )
+        sleep.assert_called_once_with(15)
+        slapd.compact.assert_called_once()
+        self.assertIsNone(harness.charm._state.restart_granted)
+
+    @mock.patch("slapd.modify_entries")
+    @mock.patch("slapd.search_entries")
+    def test_sync_ldif_action(self, search_entries, modify_entries):
+        """The sync-ldif action only writes the entries that differ."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        search_entries.return_value = slapd.parse_ldif(CURRENT_LDIF)
+
+        output = harness.run_action(
+            "sync-ldif",
+            {"ldif": DESIRED_LDIF, "delete": True, "batch-size": 2},
+        )
+
+        self.assertEqual(
+            output.results,
+            {"added": 1, "modified": 1, "deleted": 1, "batches": 2},
+        )
+        container = harness.model.unit.get_container("openldap")
+        search_entries.assert_called_once_with(
+            container,
+            "dc=canonical,dc=dev,dc=com",
+            mock.ANY,
+            "dc=canonical,dc=dev,dc=com",
+            ["objectClass", "ou", "cn", "gidNumber"],
+        )
+        records = [
+            record
+            for call in modify_entries.call_args_list
+            for record in call.args[3]
+        ]
+        self.assertEqual(
+            records,
+            [
+                "dn: cn=Sales,ou=Groups,dc=canonical,dc=dev,dc=com\n"
+                "changetype: add\n"
+                "objectClass: posixGroup\n"
+                "cn: Sales\n"
+                "gidNumber: 7000\n",
+                "dn: cn=Finance, ou=Groups, dc=canonical, dc=dev, dc=com\n"
+                "changetype: modify\n"
+                "replace: gidNumber\n"
+                "gidNumber: 5001\n"
+                "-\n",
+                "dn: cn=Marketing,ou=Groups,dc=canonical,dc=dev,dc=com\n"
+                "changetype: delete\n",
+            ],
+        )
+
+    @mock.patch("slapd.modify_entries")
+    @mock.patch("slapd.search_entries")
+    def test_sync_ldif_keeps_ancestors(self, search_entries, modify_entries):
+        """The base and containers of desired entries are never deleted."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        search_entries.return_value = slapd.parse_ldif(
+            "dn: ou=People,dc=canonical,dc=dev,dc=com\n\n"
+            "dn: ou=Staff,ou=People,dc=canonical,dc=dev,dc=com\n\n"
+            "dn: uid=dev,ou=Staff,ou=People,dc=canonical,dc=dev,dc=com\n\n"
+            "dn: uid=old,ou=People,dc=canonical,dc=dev,dc=com\n"
+        )
+
+        output = harness.run_action(
+            "sync-ldif",
+            {
+                "ldif": "dn: uid=dev,ou=Staff,ou=People,dc=canonical,"
+                "dc=dev,dc=com\nuid: dev\n",
+                "base": "ou=People,dc=canonical,dc=dev,dc=com",
+                "delete": True,
+            },
+        )
+
+        self.assertEqual(output.results["deleted"], 1)
+        self.assertEqual(
+            modify_entries.call_args.args[3][-1],
+            "dn: uid=old,ou=People,dc=canonical,dc=dev,dc=com\n"
+            "changetype: delete\n",
+        )
+
+    @mock.patch("slapd.configure_sssvlv")
+    def test_server_side_sorting(self, configure_sssvlv):
+        """Server-side sorting is enabled with its limits and indexes."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        harness.update_config(
+            {"sort-max-concurrent": 10, "sort-indexed-attributes": "cn uid"}
+        )
+
+        container = harness.model.unit.get_container("openldap")
+        configure_sssvlv.assert_called_once_with(
+            container,
+            "dc=canonical,dc=dev,dc=com",
+            {"max": 10, "max_keys": 5, "max_per_conn": 5},
+            ["cn", "uid"],
+        )
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+    @mock.patch("slapd.configure_subtree")
+    def test_subtree_databases(self, configure_subtree):
+        """Declared subtrees are served by their own glued databases."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        harness.update_config(
+            {
+                "subtree-databases": "- rdn: ou=People\n"
+                "  maxsize: 4294967296\n"
+                "  index: [uid, mail]\n"
+                "- rdn: ou=Groups\n"
+            }
+        )
+
+        container = harness.model.unit.get_container("openldap")
+        configure_subtree.assert_has_calls(
+            [
+                mock.call(
+                    container,
+                    "dc=canonical,dc=dev,dc=com",
+                    {
+                        "rdn": "ou=People",
+                        "maxsize": 4294967296,
+                        "index": ["uid", "mail"],
+                    },
+                ),
+                mock.call(
+                    container,
+                    "dc=canonical,dc=dev,dc=com",
+                    {"rdn": "ou=Groups", "maxsize": 1073741824, "index": []},
+                ),
+            ]
+        )
+
+    def test_subtree_databases_invalid(self):
+        """Malformed subtree declarations block the charm."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        for subtrees in (
+            "- maxsize: 10",
+            "- rdn: ou=People\n  index: uid",
+            "- rdn: ou=People\n  index: [uid, [mail]]",
+            "- rdn: ''",
+            "- rdn: ou=Staff,ou=People",
+        ):
+            with self.subTest(subtrees=subtrees):
+                harness.update_config({"subtree-databases": subtrees})
+
+                self.assertEqual(
+                    harness.model.unit.status,
+                    BlockedStatus("invalid subtree-databases"),
+                )
+
+    def test_warm_up_on_start(self):
+        """A freshly started unit warms up before it reports ready."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        container = harness.model.unit.get_container("openldap")
+        slapd.warm_up.assert_called_once_with(
+            container,
+            "dc=canonical,dc=dev,dc=com",
+            harness.charm._state.bind_password,
+            [
+                "(objectClass=posixGroup)",
+                "(objectClass=groupOfNames)",
+                "(objectClass=inetOrgPerson)",
+            ],
+            True,
+            1000,
+        )
+        rel_id = harness.model.get_relation("peer").id
+        self.assertEqual(
+            harness.get_relation_data(rel_id, "comsys-openldap-k8s/0")[
+                "warmup-seconds"
+            ],
+            "0.50",
+        )
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+        # Unchanged configuration neither restarts nor re-warms slapd.
+        slapd.warm_up.reset_mock()
+        harness.charm.on.config_changed.emit()
+        slapd.warm_up.assert_not_called()
+
+    def test_warmup_searches_invalid(self):
+        """Malformed priming searches block the charm."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+
+        for searches in ("uid=dev", "(uid=dev", "(uid=dev))", "(a)(b)"):
+            with self.subTest(searches=searches):
+                harness.update_config({"warmup-searches": searches})
+
+                self.assertEqual(
+                    harness.model.unit.status,
+                    BlockedStatus("invalid warmup-searches"),
+                )
+
+    def test_update_status_warms_up_restarted_slapd(self):
+        """A slapd process that was not warmed up is warmed up."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        slapd.warm_up.reset_mock()
+
+        slapd.is_warm.return_value = False
+        harness.charm.on.update_status.emit()
+
+        slapd.warm_up.assert_called_once()
+        self.assertEqual(harness.model.unit.status, ActiveStatus())
+
+    def test_update_status_keeps_status(self):
+        """Warming up on update-status leaves other statuses alone."""
+        harness = self.harness
+        simulate_lifecycle(harness)
+        harness.model.unit.status = WaitingStatus("waiting to restart")
+
+        slapd.is_warm.return_value = False
+        harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            harness.model.unit.status, WaitingStatus("waiting to restart")
+        )
+
+
+CURRENT_LDIF = """dn: dc=canonical,dc=dev,dc=com
+objectClass: dcObject
+
+dn: cn=admin,dc=canonical,dc=dev,dc=com
+cn: admin
+
+dn: ou=Groups,dc=canonical,dc=dev,dc=com
+objectClass: organizationalUnit
+ou: Groups
+
+dn: cn=Finance,ou=Groups,dc=canonical,dc=dev,dc=com
+objectClass: posixGroup
+cn: Finance
+gidNumber: 5000
+
+dn: cn=Marketing,ou=Groups,dc=canonical,dc=dev,dc=com
+objectClass: posixGroup
+cn: Marketing
+gidNumber: 6000
+"""
+
+DESIRED_LDIF = """dn: ou=Groups,dc=canonical,dc=dev,dc=com
+objectclass: organizationalUnit
+ou: Groups
+
+dn: cn=Finance, ou=Groups, dc=canonical, dc=dev, dc=com
+objectClass: posixGroup
+cn: Finance
+gidNumber: 5001
+
+dn: cn=Sales,ou=Groups,dc=canonical,dc=dev,dc=com
+objectClass: posixGroup
+cn: Sales
+gidNumber: 7000
+"""
+
+MDB_STAT_OUTPUT = """Environment Info
+  Map address: (nil)
+  Map size: 1073741824
+  Page size: 4096
+  Max pages: 262144
+  Number of pages used: 10
+  Last transaction ID: 7
+  Max readers: 126
+  Number of readers used: 0
+Freelist Status
+  Tree depth: 1
+  Branch pages: 0
+  Leaf pages: 1
+  Overflow pages: 0
+  Entries: 2
+  Free pages: 4
+"""
+
 
 def simulate_lifecycle(harness):
     """Simulate a healthy charm life-cycle.
@@ -263,3 +1094,300 @@ def make_state(data):
     app = "myapp"
     rel = type("Rel", (), {"data": {app: data}})()
     return State(app, lambda: rel)
+
+
+class TestSlapd(TestCase):
+    """Unit tests for the slapd helpers."""
+
+    @mock.patch("slapd.modify_config")
+    @mock.patch("slapd.search_config")
+    def test_ensure_indexes(self, search_config, modify_config):
+        """Only attributes that are not indexed yet get an index."""
+        search_config.return_value = [
+            (
+                "olcDatabase={1}mdb,cn=config",
+                {"olcDbIndex": ["objectClass eq", "cn,UID eq,sub"]},
+            )
+        ]
+
+        slapd.ensure_indexes(
+            "container", "olcDatabase={1}mdb,cn=config", ["cn", "uid", "sn"]
+        )
+
+        modify_config.assert_called_once_with(
+            "container",
+            "dn: olcDatabase={1}mdb,cn=config\nchangetype: modify\n"
+            "add: olcDbIndex\nolcDbIndex: sn eq\n",
+        )
+
+    @mock.patch("slapd.run_shell")
+    @mock.patch("slapd.modify_config")
+    @mock.patch("slapd.search_config")
+    def test_configure_subtree_before_superiors(
+        self, search_config, modify_config, run_shell
+    ):
+        """Subordinate databases are inserted before their superiors."""
+        main = (
+            "olcDatabase={1}mdb,cn=config",
+            {"olcSuffix": ["dc=example,dc=com"]},
+        )
+        people = (
+            "olcDatabase={2}mdb,cn=config",
+            {"olcSuffix": ["ou=People,dc=example,dc=com"]},
+        )
+        search_config.side_effect = [
+            # The main database and its settings.
+            [main],
+            [(main[0], {"olcRootDN": ["cn=admin,dc=example,dc=com"]})],
+            # The configured suffixes, then the new database.
+            [main, people],
+            [],
+            [("olcDatabase={1}mdb,cn=config", {})],
+            # Its current size and indexes.
+            [("olcDatabase={1}mdb,cn=config", {"olcDbMaxSize": ["1024"]})],
+            [("olcDatabase={1}mdb,cn=config", {})],
+        ]
+
+        slapd.configure_subtree(
+            "container",
+            "dc=example,dc=com",
+            {"rdn": "ou=Staff", "maxsize": 1024, "index": []},
+        )
+
+        self.assertEqual(
+            modify_config.call_args_list[0].args[1],
+            "dn: olcDatabase={1}mdb,cn=config\n"
+            "changetype: add\n"
+            "objectClass: olcDatabaseConfig\n"
+            "objectClass: olcMdbConfig\n"
+            "olcDatabase: {1}mdb\n"
+            "olcSuffix: ou=Staff,dc=example,dc=com\n"
+            "olcDbDirectory: /var/lib/ldap/subtrees/ou-staff\n"
+            "olcSubordinate: TRUE\n"
+            "olcRootDN: cn=admin,dc=example,dc=com\n"
+            "olcDbIndex: objectClass eq\n"
+            "olcDbMaxSize: 1024\n",
+        )
+
+    @mock.patch("slapd.follow")
+    @mock.patch("slapd.search_config")
+    def test_follow_tree_covers_subtrees(self, search_config, follow):
+        """Glued subtree databases consume and refer writes on their own."""
+        search_config.side_effect = [
+            [("olcDatabase={2}mdb,cn=config", {})],
+            [
+                (
+                    "olcDatabase={1}mdb,cn=config",
+                    {"olcSuffix": ["ou=People,dc=example,dc=com"]},
+                ),
+                (
+                    "olcDatabase={3}mdb,cn=config",
+                    {"olcSuffix": ["ou=People,dc=other,dc=com"]},
+                ),
+            ],
+        ]
+
+        slapd.follow_tree(
+            "container",
+            "dc=example,dc=com",
+            2,
+            "ldap://leader:389",
+            "pwd",
+            refer="ldap://provider:389",
+        )
+
+        calls = [call.args for call in follow.call_args_list]
+        self.assertEqual(
+            [(db_dn, refer) for _, db_dn, _, refer in calls],
+            [
+                ("olcDatabase={2}mdb,cn=config", "ldap://provider:389"),
+                ("olcDatabase={1}mdb,cn=config", "ldap://provider:389"),
+            ],
+        )
+        self.assertIn("rid=002 ", calls[0][2])
+        self.assertIn('searchbase="dc=example,dc=com"', calls[0][2])
+        self.assertIn("rid=012 ", calls[1][2])
+        self.assertIn('searchbase="ou=People,dc=example,dc=com"', calls[1][2])
+        self.assertIn('binddn="cn=admin,dc=example,dc=com"', calls[1][2])
+
+    @mock.patch("slapd.run")
+    def test_search_entries_missing_base(self, run):
+        """A missing search base reads as an empty subtree."""
+        run.side_effect = ExecError(
+            ["ldapsearch"], 32, "", "No such object (32)"
+        )
+
+        entries = slapd.search_entries(
+            "container", "dc=example,dc=com", "pwd", "ou=new,dc=example", []
+        )
+
+        self.assertEqual(entries, [])
+
+    def test_binary_values_round_trip(self):
+        """Values that are not UTF-8 text are kept as bytes."""
+        photo = b"\xff\xd8\xff\xe0"
+        desired = slapd.parse_ldif(
+            "dn: uid=dev,dc=example,dc=com\njpegPhoto:: /9j/4A==\n"
+        )
+
+        self.assertEqual(
+            desired, [("uid=dev,dc=example,dc=com", {"jpegPhoto": [photo]})]
+        )
+        adds, _, _ = slapd.diff_entries([], desired)
+        self.assertEqual(
+            adds,
+            [
+                "dn: uid=dev,dc=example,dc=com\nchangetype: add\n"
+                "jpegPhoto:: /9j/4A==\n"
+            ],
+        )
+
+    @mock.patch("slapd.ensure_overlay")
+    @mock.patch("slapd.add_database")
+    @mock.patch("slapd.modify_config")
+    @mock.patch("slapd.search_config")
+    def test_configure_proxy_updates_idassert(
+        self, search_config, modify_config, add_database, ensure_overlay
+    ):
+        """The proxy identity and access are only rewritten when changed."""
+        db_dn = "olcDatabase={2}ldap,cn=config"
+        add_database.return_value = db_dn
+        ensure_overlay.return_value = f"olcOverlay={{0}}pcache,{db_dn}"
+        search_config.side_effect = [
+            [
+                (
+                    db_dn,
+                    {
+                        "olcDbURI": ["ldap://remote"],
+                        "olcDbIDAssertBind": [
+                            "mode=none flags=prescriptive bindmethod=simple "
+                            'timeout=0 binddn="cn=proxy,dc=example,dc=com" '
+                            'credentials="old"'
+                        ],
+                    },
+                )
+            ],
+            [(ensure_overlay.return_value, {"olcPcacheTemplate": []})],
+            [("olcDatabase={0}mdb", {})],
+        ]
+
+        slapd.configure_proxy(
+            "container",
+            "dc=example,dc=com",
+            "ldap://remote",
+            {"templates": [], "ttl": 60, "attributes": "*", "max_entries": 1},
+            {"dn": "cn=proxy,dc=example,dc=com", "password": "new"},
+        )
+
+        self.assertEqual(
+            add_database.call_args.args[3]["olcAccess"],
+            "to * by users read by * none",
+        )
+        self.assertEqual(
+            [call.args[1] for call in modify_config.call_args_list],
+            [
+                f"dn: {db_dn}\nchangetype: modify\n"
+                "replace: olcDbIDAssertBind\n"
+                "olcDbIDAssertBind: bindmethod=simple "
+                'binddn="cn=proxy,dc=example,dc=com" credentials="new" '
+                "mode=none\n",
+                f"dn: {db_dn}\nchangetype: modify\n"
+                "replace: olcAccess\n"
+                "olcAccess: to * by users read by * none\n",
+            ],
+        )
+
+        # Unchanged settings are left alone.
+        modify_config.reset_mock()
+        search_config.side_effect = [
+            [
+                (
+                    db_dn,
+                    {
+                        "olcDbURI": ["ldap://remote"],
+                        "olcDbIDAssertBind": [
+                            'binddn="cn=proxy,dc=example,dc=com" '
+                            'credentials="new"'
+                        ],
+                        "olcAccess": ["{0}to * by users read by * none"],
+                    },
+                )
+            ],
+            [(ensure_overlay.return_value, {"olcPcacheTemplate": []})],
+            [("olcDatabase={0}mdb", {})],
+        ]
+        slapd.configure_proxy(
+            "container",
+            "dc=example,dc=com",
+            "ldap://remote",
+            {"templates": [], "ttl": 60, "attributes": "*", "max_entries": 1},
+            {"dn": "cn=proxy,dc=example,dc=com", "password": "new"},
+        )
+        modify_config.assert_not_called()
+
+    @mock.patch("slapd.time.monotonic")
+    @mock.patch("slapd.run_shell")
+    def test_warm_up_until_latency_settles(self, run_shell, monotonic):
+        """Priming searches repeat until a pass is not much faster."""
+        # Start, then two passes of 2s and 1.9s, then the end.
+        monotonic.side_effect = [0.0, 1.0, 3.0, 3.0, 4.9, 5.0]
+
+        duration = slapd.warm_up(
+            "container", "dc=example,dc=com", "pwd", ["(uid=dev)"]
+        )
+
+        self.assertEqual(duration, 5.0)
+        scripts = [call.args[1] for call in run_shell.call_args_list]
+        self.assertEqual(len(scripts), 4)
+        self.assertIn("-name data.mdb -exec cat", scripts[0])
+        self.assertIn("'(uid=dev)' > /dev/null", scripts[1])
+        self.assertEqual(scripts[1], scripts[2])
+        self.assertEqual(scripts[3], "pidof slapd > /var/run/openldap.warm")
+        self.assertEqual(
+            [call.kwargs.get("timeout") for call in run_shell.call_args_list],
+            [300, 299.0, 297.0, None],
+        )
+
+    @mock.patch("slapd.run_shell")
+    def test_warm_up_search_failure(self, run_shell):
+        """A failing priming search still marks slapd as warm."""
+        run_shell.side_effect = [
+            ExecError(["sh"], 32, "", "No such object (32)"),
+            "",
+        ]
+
+        slapd.warm_up(
+            "container",
+            "dc=example,dc=com",
+            "pwd",
+            ["(objectClass=posixGroup)"],
+            read_ahead=False,
+        )
+
+        self.assertEqual(
+            run_shell.call_args.args[1],
+            "pidof slapd > /var/run/openldap.warm",
+        )
+
+    @mock.patch("slapd.run_shell")
+    def test_warm_up_cut_short(self, run_shell):
+        """A warm-up that times out still marks slapd as warm."""
+        run_shell.side_effect = [
+            ChangeError("timed out", mock.Mock()),
+            "",
+        ]
+
+        slapd.warm_up(
+            "container",
+            "dc=example,dc=com",
+            "pwd",
+            ["(objectClass=inetOrgPerson)"],
+            read_ahead=False,
+            size_limit=1000,
+        )
+
+        scripts = [call.args[1] for call in run_shell.call_args_list]
+        self.assertEqual(len(scripts), 2)
+        self.assertIn(" -z 1000 ", scripts[0])
+        self.assertTrue(scripts[0].endswith("|| test $? -eq 4; }"))
+        self.assertEqual(scripts[1], "pidof slapd > /var/run/openldap.warm")